@@ -0,0 +1,390 @@
+"""
+microbenchmarks of the runtime overhead of the codecrumbs shims.
+
+Every benchmark is reported relative to an undecorated reference (a normal
+attribute access or a normal function call), which makes the numbers
+comparable between machines. The ratios are compared with the baseline of
+the running python version in `baseline.json`.
+
+The allowed slowdown is the larger one of `--tolerance` and three times the
+noise (the relative standard deviation of the ratios of the repeats).
+Regressions are measured a second time before they are reported.
+
+usage:
+
+    python benchmarks/run.py                # compare with the baseline
+    python benchmarks/run.py --save         # update the baseline of this python version
+    python benchmarks/run.py -k attribute   # only benchmarks which contain "attribute"
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import types
+import warnings
+from pathlib import Path
+
+from codecrumbs import argument_renamed
+from codecrumbs import attribute_renamed
+from codecrumbs import configure
+from codecrumbs import globals_renamed
+from codecrumbs._calling_expression import calling_expression
+from codecrumbs._rewrite_code import ChangeRecorder
+from codecrumbs._source_cache import CachedSource
+from codecrumbs._source_cache import source_cache
+
+baseline_file = Path(__file__).parent / "baseline.json"
+
+# the ratios depend on the python version (specialization of the bytecode)
+python_version = f"{sys.version_info[0]}.{sys.version_info[1]}"
+
+# minimal allowed slowdown compared to the baseline ratio
+default_tolerance = 0.25
+
+# allowed slowdown in multiples of the noise
+noise_factor = 3
+
+
+class Example:
+    old = attribute_renamed("new")
+
+    def __init__(self):
+        self.new = 1
+
+    @argument_renamed("old_arg", "new_arg")
+    def method(self, new_arg):
+        return new_arg
+
+    def plain_method(self, new_arg):
+        return new_arg
+
+
+@argument_renamed("old_arg", "new_arg")
+def function(new_arg):
+    return new_arg
+
+
+def plain_function(new_arg):
+    return new_arg
+
+
+e = Example()
+
+plain_module = types.ModuleType("plain_module")
+plain_module.new = 1
+
+renamed_module = types.ModuleType("renamed_module")
+renamed_module.new = 1
+renamed_module.__getattr__ = globals_renamed("renamed_module", {"old": "new"})
+sys.modules["renamed_module"] = renamed_module
+
+
+def lookup():
+    return calling_expression()
+
+
+def clear_lookup_caches():
+    CachedSource._class_local("__executing_cache", {}).clear()
+    for source in source_cache._entries.values():
+        source.nodes_at.clear()
+
+
+# the loops are normal functions, because codecrumbs needs the source of the
+# call sites (which is not available for code generated by timeit)
+benchmarks = {}
+
+
+def benchmark(reference, setup=None):
+    """
+    registers a loop `f(n)` together with the loop of the undecorated reference
+    """
+
+    def register(f):
+        benchmarks[f.__name__] = (f, reference, setup)
+        return f
+
+    return register
+
+
+def ref_get(n):
+    for _ in range(n):
+        e.new
+
+
+def ref_set(n):
+    for _ in range(n):
+        e.new = 1
+
+
+def ref_delete(n):
+    for _ in range(n):
+        del e.new
+        e.new = 1
+
+
+def ref_getattr(n):
+    for _ in range(n):
+        getattr(e, "new")
+
+
+def ref_hasattr(n):
+    for _ in range(n):
+        hasattr(e, "new")
+
+
+def ref_module_get(n):
+    for _ in range(n):
+        plain_module.new
+
+
+def ref_function_keyword(n):
+    for _ in range(n):
+        plain_function(new_arg=1)
+
+
+def ref_function_positional(n):
+    for _ in range(n):
+        plain_function(1)
+
+
+def ref_method_keyword(n):
+    for _ in range(n):
+        e.plain_method(new_arg=1)
+
+
+def ref_bound_method(n):
+    for _ in range(n):
+        e.plain_method
+
+
+@benchmark(ref_get)
+def attribute_get(n):
+    for _ in range(n):
+        e.old
+
+
+@benchmark(ref_get)
+def attribute_get_new(n):
+    for _ in range(n):
+        e.new
+
+
+@benchmark(ref_set)
+def attribute_set(n):
+    for _ in range(n):
+        e.old = 1
+
+
+@benchmark(ref_delete)
+def attribute_delete(n):
+    for _ in range(n):
+        del e.old
+        e.new = 1
+
+
+@benchmark(ref_getattr)
+def getattr_literal(n):
+    for _ in range(n):
+        getattr(e, "old")
+
+
+@benchmark(ref_hasattr)
+def hasattr_literal(n):
+    for _ in range(n):
+        hasattr(e, "old")
+
+
+@benchmark(ref_module_get)
+def module_get(n):
+    for _ in range(n):
+        renamed_module.old
+
+
+@benchmark(ref_module_get)
+def module_get_new(n):
+    for _ in range(n):
+        renamed_module.new
+
+
+@benchmark(ref_function_keyword)
+def function_new_keyword(n):
+    for _ in range(n):
+        function(new_arg=1)
+
+
+@benchmark(ref_function_keyword)
+def function_old_keyword(n):
+    for _ in range(n):
+        function(old_arg=1)
+
+
+@benchmark(ref_function_positional)
+def function_positional(n):
+    for _ in range(n):
+        function(1)
+
+
+@benchmark(ref_method_keyword)
+def method_new_keyword(n):
+    for _ in range(n):
+        e.method(new_arg=1)
+
+
+@benchmark(ref_method_keyword)
+def method_old_keyword(n):
+    for _ in range(n):
+        e.method(old_arg=1)
+
+
+@benchmark(ref_bound_method)
+def bound_method_get(n):
+    for _ in range(n):
+        e.method
+
+
+@benchmark(ref_function_positional)
+def calling_expression_repeat(n):
+    for _ in range(n):
+        lookup()
+
+
+@benchmark(ref_function_positional, setup=clear_lookup_caches)
+def calling_expression_first_hit(n):
+    # n is always 1, the cache is cleared before every call
+    lookup()
+
+
+def measure(loop, number, setup=None):
+    """
+    returns the time for one iteration of `loop` in ns
+    """
+    total = 0
+    for _ in range(number if setup else 1):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        loop(1 if setup else number)
+        total += time.perf_counter_ns() - start
+    return total / number
+
+
+def run(names, number, repeat):
+    """
+    returns the results of the benchmarks,
+    which is None for benchmarks which are not supported by this python version
+    """
+    results = {}
+
+    recorder = ChangeRecorder()
+    with warnings.catch_warnings(), recorder.activate():
+        # the cost of the warnings module is not part of codecrumbs
+        warnings.simplefilter("ignore")
+
+        for name in names:
+            loop, reference, setup = benchmarks[name]
+            n = number if setup is None else max(number // 100, 10)
+            try:
+                # warm up the call site caches
+                loop(1)
+            except AttributeError:
+                # executing can not find every expression on python < 3.11 (`del obj.attr`)
+                results[name] = None
+                continue
+
+            # the loop and the reference are measured alternately,
+            # which makes the ratio less sensitive to the load of the machine
+            times = [
+                (measure(loop, n, setup), measure(reference, n)) for _ in range(repeat)
+            ]
+            ns = min(t for t, _ in times)
+            ratios = [t / ref_t for t, ref_t in times]
+            results[name] = {
+                "ns": ns,
+                "ratio": ns / min(ref_t for _, ref_t in times),
+                "noise": statistics.pstdev(ratios) / statistics.mean(ratios),
+            }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'benchmark':<32}{'ns':>10}{'ratio':>10}{'baseline':>10}{'limit':>10}")
+    for name, result in results.items():
+        if result is None:
+            print(f"{name:<32}{'not supported by python ' + python_version:>40}")
+            continue
+
+        base = baseline.get(name)
+        line = f"{name:<32}{result['ns']:>10.1f}{result['ratio']:>10.2f}"
+        if base is None:
+            print(line + f"{'-':>10}")
+            continue
+
+        noise = max(result["noise"], base.get("noise", 0))
+        limit = base["ratio"] * (1 + max(tolerance, noise_factor * noise))
+        print(line + f"{base['ratio']:>10.2f}{limit:>10.2f}", end="")
+        if result["ratio"] > limit:
+            regressions.append(name)
+            print("  regression", end="")
+        print()
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-k", action="append", default=[], dest="selected")
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=default_tolerance)
+    parser.add_argument("--save", action="store_true", help="update the baseline")
+    parser.add_argument(
+        "--no-compare", action="store_true", help="do not fail on regressions"
+    )
+    args = parser.parse_args(args)
+
+    # the benchmarks measure the recording mode, even if CODECRUMBS_MODE is set
+    configure(mode="record")
+
+    selected = args.selected or [""]
+    names = [name for name in benchmarks if any(s in name for s in selected)]
+    results = run(names, args.number, args.repeat)
+
+    baselines = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+    baseline = baselines.setdefault(python_version, {})
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        for name, result in results.items():
+            if result is None:
+                baseline.pop(name, None)
+                continue
+            baseline[name] = {
+                "ratio": round(result["ratio"], 2),
+                "noise": round(result["noise"], 3),
+            }
+        baseline_file.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"baseline for python {python_version} saved to {baseline_file}")
+        return 0
+
+    if regressions and not args.no_compare:
+        # a regression has to be confirmed by a second measurement
+        print(f"measure again: {', '.join(regressions)}")
+        again = run(regressions, args.number, args.repeat)
+        regressions = compare(
+            {
+                name: min(results[name], again[name], key=lambda r: r["ratio"])
+                for name in regressions
+            },
+            baseline,
+            args.tolerance,
+        )
+
+    if regressions and not args.no_compare:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -49,3 +49,9 @@ def docs(session):
     session.install("poetry")
     session.run("poetry", "install", "--with=doc")
     session.run("mkdocs", "build")
+
+
+@nox.session(python=["3.9", "3.10", "3.11"])
+def benchmark(session):
+    session.run_always("poetry", "install", "--with=dev", external=True)
+    session.run("python", "benchmarks/run.py", *session.posargs)
@@ -1,9 +1,23 @@
+from . import _config
 from ._argument import argument_renamed
 from ._attribute import attribute_renamed
+from ._config import configure
+from ._module import globals_renamed
 
 
 __version__ = "0.1.0"
 
+_config.configure_from_environment()
+
+
+def __getattr__(name):
+    # the import hook needs ast and the static scanner, which are only loaded when it is used
+    if name == "install_import_hook":
+        from ._import_hook import install_import_hook
+
+        return install_import_hook
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def foo(a: int):
     """
@@ -4,20 +4,102 @@ import runpy
 import sys
 from pathlib import Path
 
+from ._config import configure
 from ._rewrite_code import ChangeRecorder
+from ._shard import disable_child_recording
+from ._shard import enable_child_recording
+from ._shard import merge_shards
+from ._store import CrumbStore
 
 
 def main():
     parser = argparse.ArgumentParser(prog="codecrumbs")
     subparsers = parser.add_subparsers(dest="subcommand")
     run_parser = subparsers.add_parser("run", help="run a python script")
-    run_parser.add_argument(
+    run_output = run_parser.add_mutually_exclusive_group()
+    run_output.add_argument(
         "--fix",
         help="fix deprecated code after the command terminates",
         action="store_true",
     )
+    run_output.add_argument(
+        "--store",
+        help="add the fixes to a crumb store which can be applied later with `codecrumbs apply`",
+        type=Path,
+    )
+    run_parser.add_argument(
+        "--profile",
+        help="show the overhead of codecrumbs when the command terminates",
+        action="store_true",
+    )
+    run_parser.add_argument(
+        "--tracemalloc",
+        help="measure the memory which is allocated by codecrumbs (with --profile)",
+        action="store_true",
+    )
+    run_parser.add_argument(
+        "--flush-interval",
+        help="write the fixes every SECONDS to the store or patch file while the script is running",
+        type=float,
+        metavar="SECONDS",
+    )
+    run_parser.add_argument(
+        "--flush-size",
+        help="write the fixes when N new replacements are recorded",
+        type=int,
+        metavar="N",
+    )
+    run_parser.add_argument(
+        "--flush-signal",
+        help="write the fixes when the process receives this signal (USR1 for example)",
+        metavar="SIGNAL",
+    )
     run_parser.add_argument("command", nargs="*")
 
+    apply_parser = subparsers.add_parser(
+        "apply", help="apply all fixes of a crumb store"
+    )
+    apply_parser.add_argument("store", type=Path)
+
+    scan_parser = subparsers.add_parser(
+        "scan", help="search deprecated code without running it"
+    )
+    scan_parser.add_argument(
+        "-m",
+        "--module",
+        help="the library which defines the renamings (can be used multiple times)",
+        action="append",
+        required=True,
+        dest="modules",
+    )
+    scan_parser.add_argument(
+        "-a",
+        "--attribute",
+        help="rename this attribute for every object, not only for the classes and modules of the library (can be used multiple times)",
+        action="append",
+        default=[],
+        dest="attributes",
+    )
+    scan_output = scan_parser.add_mutually_exclusive_group()
+    scan_output.add_argument(
+        "--fix",
+        help="fix the deprecated code instead of printing a patch",
+        action="store_true",
+    )
+    scan_output.add_argument(
+        "--store",
+        help="add the fixes to a crumb store which can be applied later with `codecrumbs apply`",
+        type=Path,
+    )
+    scan_parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of worker processes (default: number of cpus)",
+        type=int,
+        default=None,
+    )
+    scan_parser.add_argument("paths", nargs="+", type=Path)
+
     args = parser.parse_args()
     if args.subcommand == "run":
         script, *cmd_args = args.command
@@ -26,11 +108,45 @@ def main():
 
         init_globals = {"__file__": Path(script).resolve(), "__package__": ""}
 
+        # the changes have to be recorded, even if CODECRUMBS_MODE=alias is set
+        configure(mode="record")
+
         change_recorder = ChangeRecorder()
         script_path = Path(script).resolve()
 
+        if args.profile and args.tracemalloc:
+            import tracemalloc
+
+            tracemalloc.start()
+
+        # child processes write their changes to shards
+        shard_dir = enable_child_recording()
+
+        patch_file = script_path.with_name(script_path.stem + "_codecrumbs.patch")
+
+        flusher = None
+        if args.flush_interval or args.flush_size or args.flush_signal:
+            import signal
+
+            from ._flush import PeriodicFlusher
+
+            signum = None
+            if args.flush_signal:
+                name = args.flush_signal.upper()
+                signum = getattr(
+                    signal, name if name.startswith("SIG") else "SIG" + name
+                )
+
+            flusher = PeriodicFlusher(
+                change_recorder,
+                CrumbStore(args.store) if args.store else patch_file,
+                interval=args.flush_interval,
+                max_pending=args.flush_size,
+                signum=signum,
+            ).start()
+
         try:
-            with change_recorder.activate():
+            with change_recorder.activate(all_threads=True):
                 runpy.run_path(
                     str(script_path),
                     init_globals=init_globals,
@@ -39,15 +155,62 @@ def main():
         except:
             raise
         finally:
-            if args.fix:
+            if flusher is not None:
+                flusher.stop()
+            disable_child_recording()
+            merge_shards(change_recorder, shard_dir)
+
+            if args.profile:
+                from ._stats import traced_memory
+
+                change_recorder.stats.traced_memory = traced_memory()
+                print("codecrumbs profile:", file=sys.stderr)
+                print(change_recorder.profile_report(), end="", file=sys.stderr)
+
+            if args.store:
+                CrumbStore(args.store).add(change_recorder)
+            elif args.fix:
                 change_recorder.fix_all()
             else:
-                change_recorder.generate_patchfile(
-                    script_path.with_name(script_path.stem + "_codecrumbs.patch")
-                )
+                change_recorder.generate_patchfile(patch_file)
 
         exit(0)
 
+    elif args.subcommand == "apply":
+        store = CrumbStore(args.store)
+        change_recorder = ChangeRecorder()
+        store.load(change_recorder)
+        change_recorder.fix_all()
+        store.prune()
+
+    elif args.subcommand == "scan":
+        import importlib
+
+        from ._static import scan
+
+        # like `python -m`, the library can be imported from the current directory
+        sys.path.insert(0, "")
+
+        for module in args.modules:
+            importlib.import_module(module)
+
+        change_recorder = ChangeRecorder()
+        scan(
+            args.paths,
+            args.modules,
+            attributes=args.attributes,
+            max_workers=args.jobs,
+            recorder=change_recorder,
+        )
+
+        if args.store:
+            CrumbStore(args.store).add(change_recorder)
+        elif args.fix:
+            change_recorder.fix_all()
+        else:
+            for line in change_recorder.generate_patch(Path.cwd()):
+                sys.stdout.write(line)
+
     else:
         assert False, f"{args.subcommand} is not implemented"
 
@@ -1,16 +1,19 @@
-import inspect
+import sys
 import textwrap
-import token
+import time
 import warnings
-from dataclasses import dataclass
-from functools import partial
+import weakref
+from functools import update_wrapper
+from typing import NamedTuple
 
+from . import _config
 from ._calling_expression import calling_expression
+from ._calling_expression import FixIndex
+from ._rewrite_code import ChangeRecorder
 from ._rewrite_code import replace
 
 
-@dataclass
-class DeprecationRenaming:
+class DeprecationRenaming(NamedTuple):
     since: str
     old_name: str
     new_name: str
@@ -20,11 +23,23 @@ class DeprecationRenaming:
         return f"\n{directive}\n\n    parameter *{self.old_name}* was renamed to *{self.new_name}*\n"
 
 
+_missing = object()
+
+
+def _present(**ka):
+    return {key: value for key, value in ka.items() if value is not _missing}
+
+
 class FunctionWrapper:
+    # all functions with renamed arguments, which are used by `codecrumbs scan`
+    registry: "weakref.WeakSet[FunctionWrapper]" = weakref.WeakSet()
+
     @staticmethod
     def of(obj):
         if isinstance(obj, FunctionWrapper):
             return obj
+        if hasattr(obj, "_codecrumbs_wrapper"):
+            return obj._codecrumbs_wrapper
         return FunctionWrapper(obj)
 
     def __init__(self, function) -> None:
@@ -32,16 +47,138 @@ class FunctionWrapper:
         self.old_params: dict[str, str] = {}
         self.deprecations: list[DeprecationRenaming] = []
         self.since_version: str | None = None
+        self.fixes = FixIndex()
+        self.shim = self._generate_shim()
+
+    def _generate_shim(self):
+        """
+        returns a plain function which calls `self.f` directly when only the
+        current argument names are used.
+
+        A function is used instead of `__call__`, because functions bind and
+        call much faster than instances of a class with `__get__` and `__call__`.
+        """
+        shim = self._generate_signature_shim() or self._generic_shim()
+        update_wrapper(shim, self.f)
+        shim._codecrumbs_wrapper = self  # type: ignore[attr-defined]
+        return shim
+
+    def _generic_shim(self):
+        f = self.f
+        old_names = self.old_params.keys()
+        call_deprecated = self._call_deprecated
+
+        def shim(*a, **ka):
+            if not ka or old_names.isdisjoint(ka):
+                return f(*a, **ka)
+            return call_deprecated(a, ka)
+
+        return shim
+
+    def _generate_signature_shim(self):
+        """
+        generates a function with the real signature of `self.f` and keyword
+        only parameters for the old names, which avoids the packing and unpacking
+        of `*args` and `**kwargs` on every call.
+
+        Returns None if the signature is not supported.
+        """
+        import inspect
+
+        try:
+            parameters = list(inspect.signature(self.f).parameters.values())
+        except (TypeError, ValueError):
+            return None
+
+        P = inspect.Parameter
+        if not self.old_params or any(
+            p.kind not in (P.POSITIONAL_OR_KEYWORD, P.KEYWORD_ONLY)
+            or p.name.startswith("_codecrumbs_")
+            for p in parameters
+        ):
+            return None
+
+        targets = set(self.old_params.values())
+
+        # the targets get a default, which is not possible if a required
+        # positional parameter follows them
+        positional = [p for p in parameters if p.kind == P.POSITIONAL_OR_KEYWORD]
+        first_target = next(
+            (i for i, p in enumerate(positional) if p.name in targets), len(positional)
+        )
+        if any(
+            p.name not in targets and p.default is P.empty
+            for p in positional[first_target:]
+        ):
+            return None
+
+        defaults = {}
+
+        def param(p):
+            if p.name in targets:
+                return f"{p.name}=_codecrumbs_missing"
+            if p.default is not P.empty:
+                defaults[p.name] = p.default
+                return f"{p.name}=_codecrumbs_defaults[{p.name!r}]"
+            return p.name
+
+        keyword = [p for p in parameters if p.kind == P.KEYWORD_ONLY]
+        all_names = [p.name for p in parameters] + list(self.old_params)
+
+        present = ", ".join(f"{name}={name}" for name in all_names)
+        call = ", ".join(
+            [p.name for p in positional] + [f"{p.name}={p.name}" for p in keyword]
+        )
+
+        lines = [
+            "def shim({}):".format(
+                ", ".join(
+                    [param(p) for p in positional]
+                    + ["*"]
+                    + [param(p) for p in keyword]
+                    + [f"{old}=_codecrumbs_missing" for old in self.old_params]
+                )
+            ),
+            "    if {}:".format(
+                " or ".join(
+                    f"{old} is not _codecrumbs_missing" for old in self.old_params
+                )
+            ),
+            f"        return _codecrumbs_call_deprecated((), _codecrumbs_present({present}))",
+        ]
 
-    def __get__(self, obj, cls):
-        if obj is not None:
-            return partial(self, obj)
-        else:
-            return self
+        for p in parameters:
+            if p.name in targets:
+                lines.append(f"    if {p.name} is _codecrumbs_missing:")
+                if p.default is P.empty:
+                    # let the function raise the TypeError for the missing argument
+                    lines.append(
+                        f"        return _codecrumbs_f(**_codecrumbs_present({present}))"
+                    )
+                else:
+                    defaults[p.name] = p.default
+                    lines.append(f"        {p.name} = _codecrumbs_defaults[{p.name!r}]")
+
+        lines.append(f"    return _codecrumbs_f({call})")
+
+        namespace = {
+            "_codecrumbs_f": self.f,
+            "_codecrumbs_call_deprecated": self._call_deprecated,
+            "_codecrumbs_missing": _missing,
+            "_codecrumbs_present": _present,
+            "_codecrumbs_defaults": defaults,
+        }
+        exec("\n".join(lines), namespace)
+        return namespace["shim"]
 
     def __call__(self, *a, **ka):
+        return self.shim(*a, **ka)
+
+    def _call_deprecated(self, a, ka):
+        if _config.alias_mode:
+            return self._call_alias(a, ka)
+
         new_ka = {}
-        changed = False
         for key in ka:
             if key in self.old_params:
                 old_arg = key
@@ -55,43 +192,60 @@ class FunctionWrapper:
                 warnings.warn(
                     f'argument name "{old_arg}=" should be replaced with "{new_arg}=" (fixable with codecrumbs)',
                     DeprecationWarning,
-                    stacklevel=2,
+                    stacklevel=3,
                 )
 
                 new_ka[new_arg] = ka[old_arg]
-                changed = True
             else:
                 new_ka[key] = ka[key]
 
-        if changed:
-            expr = calling_expression()
+        frame = sys._getframe(2)
+        recorder = ChangeRecorder.current
+        site = (id(frame.f_code), frame.f_lasti, self.fixes)
+        if site not in recorder.call_sites:
+            if recorder.sample():
+                started = time.perf_counter()
+                try:
+                    self._fix_call_site()
+                finally:
+                    recorder.add_introspection_time(time.perf_counter() - started)
+                recorder.call_sites[site] = frame.f_code
+
+        return self.f(*a, **new_ka)
 
-            tokens = expr.tokens
+    def _call_alias(self, a, ka):
+        new_ka = {}
+        for key, value in ka.items():
+            new_key = self.old_params.get(key, key)
+            if new_key in new_ka or (new_key != key and new_key in ka):
+                raise TypeError(
+                    f"{key}=... and {new_key}=... can not be used at the same time"
+                )
+            new_ka[new_key] = value
+        return self.f(*a, **new_ka)
 
-            for arg in expr.expr.keywords:
-                if arg.arg not in self.old_params:
-                    continue
+    def _fix_call_site(self):
+        expr = calling_expression(back=3)
 
-                arg_value = arg.value
-                start = arg_value.lineno, arg_value.col_offset
+        tokens = expr.tokens
 
-                mytokens = [
-                    t
-                    for t in tokens
-                    if t.start < start and t.type in (token.NAME, token.OP)
-                ]
+        for arg in expr.expr.keywords:
+            if arg.arg not in self.old_params:
+                continue
 
-                name, op = mytokens[-2:]
-                name.filename = expr.filename
+            arg_value = arg.value
+            start = expr.source.char_position(arg_value.lineno, arg_value.col_offset)
 
-                assert op.string == "=", op.string
-                assert name.string == arg.arg
+            name, op = tokens.names_and_ops_before(start, 2)
 
-                replace(name, self.old_params[arg.arg])
+            assert op.string == "=", op.string
+            assert name.string == arg.arg
 
-        return self.f(*a, **new_ka)
+            replace(name, self.old_params[arg.arg])
 
     def _add_renaming(self, old_param, new_param, since):
+        import inspect
+
         # check missuse
         signature = inspect.signature(self.f)
         if old_param in signature.parameters:
@@ -104,12 +258,19 @@ class FunctionWrapper:
                     "parameter 'old' should be renamed to 'new' in the signature"
                 )
         self.old_params[old_param] = new_param
+        FunctionWrapper.registry.add(self)
         self.deprecations.append(
             DeprecationRenaming(since=since, old_name=old_param, new_name=new_param)
         )
 
+        self.shim = self._generate_shim()
+        self.shim.__doc__ = self.__doc__
+        self.shim.__signature__ = self.__signature__  # type: ignore[attr-defined]
+
     @property
     def __signature__(self):
+        import inspect
+
         signature = inspect.signature(self.f)
         parameters = list(signature.parameters.values()) + [
             signature.parameters[v].replace(
@@ -175,6 +336,6 @@ def argument_renamed(old_name: str, new_name: str, *, since=None):
         wrapper = FunctionWrapper.of(f)
         wrapper._add_renaming(old_name, new_name, since)
 
-        return wrapper
+        return wrapper.shim
 
     return w
@@ -1,21 +1,14 @@
-import ast
+import sys
+import time
 import warnings
+import weakref
 
 from ._calling_expression import calling_expression
+from ._calling_expression import FixIndex
+from ._rewrite_code import ChangeRecorder
 from ._rewrite_code import replace
 
 
-class FixIndex:
-    def __init__(self):
-        self.index = set()
-
-    def is_first(self, expr):
-        fix_id = (expr.filename, expr.ast_index)
-        first = fix_id not in self.index
-        self.index.add(fix_id)
-        return first
-
-
 def attribute_renamed(new_name, *, since=None):
     """
     Specifies that all read and write accesses of an attribute should be renamed.
@@ -88,7 +81,64 @@ def attribute_renamed(new_name, *, since=None):
     return RenameAttribute(new_name, since)
 
 
+def fix_attribute_access(expr, current_name, new_name, stacklevel):
+    """
+    warns about `obj.current_name` or `getattr(obj, "current_name")` in expr and records the fix
+    """
+    import ast
+
+    e = expr.expr
+
+    if isinstance(e, ast.Call):
+        e = e.func
+
+    if isinstance(e, ast.Name) and e.id in (
+        "getattr",
+        "hasattr",
+        "setattr",
+        "delattr",
+    ):
+        namearg = expr.expr.args[1]
+        if isinstance(namearg, ast.Constant):
+            # getattr(obj,"attr")
+            warnings.warn(
+                f'{e.id}(..., "{current_name}") should be replaced with {e.id}(..., "{new_name}") (fixable with codecrumbs)',
+                DeprecationWarning,
+                stacklevel=stacklevel,
+            )
+            replace(namearg, f'"{new_name}"')
+        else:
+            # getattr(obj,attr_var)
+            warnings.warn(
+                f'{e.id}(..., attr) is called with attr="{current_name}" but should be called with "{new_name}" (please fix manual)',
+                DeprecationWarning,
+                stacklevel=stacklevel,
+            )
+    else:
+        assert isinstance(e, ast.Attribute), e
+        # obj.attr
+        warnings.warn(
+            f'".{current_name}" should be replaced with ".{new_name}" (fixable with codecrumbs)',
+            DeprecationWarning,
+            stacklevel=stacklevel,
+        )
+
+        start = expr.source.char_position(e.value.end_lineno, e.value.end_col_offset)
+        end = expr.source.char_position(e.end_lineno, e.end_col_offset)
+
+        # the value can be followed by closing parentheses, newlines and comments
+        dot, name = expr.tokens.names_and_ops_between(start, end)[-2:]
+
+        assert dot.string == "."
+        assert name.string == current_name
+
+        replace(name, new_name)
+
+
 class RenameAttribute:
+    # all renamed attributes, which are used by `codecrumbs scan`
+    registry: "weakref.WeakSet[RenameAttribute]" = weakref.WeakSet()
+
     def __init__(self, newname, since):
         self.new_name = newname
         self.fixes = FixIndex()
@@ -97,73 +147,84 @@ class RenameAttribute:
     def __set_name__(self, owner, name):
         self._owner = owner
         self.current_name = name
-
-    def __generic_fix(self):
-
-        expr = calling_expression(back=2)
-        if self.fixes.is_first(expr):
-            e = expr.expr
-
-            if isinstance(e, ast.Call):
-                e = e.func
-
-            if isinstance(e, ast.Name) and e.id in (
-                "getattr",
-                "hasattr",
-                "setattr",
-                "delattr",
-            ):
-                namearg = expr.expr.args[1]
-                if isinstance(namearg, ast.Constant):
-                    # getattr(obj,"attr")
-                    warnings.warn(
-                        f'{e.id}(..., "{self.current_name}") should be replaced with {e.id}(..., "{self.new_name}") (fixable with codecrumbs)',
-                        DeprecationWarning,
-                        stacklevel=3,
-                    )
-                    replace(namearg, f'"{self.new_name}"')
-                else:
-                    # getattr(obj,attr_var)
-                    warnings.warn(
-                        f'{e.id}(..., attr) is called with attr="{self.current_name}" but should be called with "{self.new_name}" (please fix manual)',
-                        DeprecationWarning,
-                        stacklevel=3,
-                    )
-            else:
-                assert isinstance(e, ast.Attribute), e
-                # obj.attr
-                warnings.warn(
-                    f'".{self.current_name}" should be replaced with ".{self.new_name}" (fixable with codecrumbs)',
-                    DeprecationWarning,
-                    stacklevel=3,
+        RenameAttribute.registry.add(self)
+
+    def __generic_fix(self, recorder, site, code):
+        if not recorder.sample():
+            # getattr(obj, "name") can not be distinguished without the analysis of the call site
+            warnings.warn(
+                f'".{self.current_name}" should be replaced with ".{self.new_name}" (fixable with codecrumbs)',
+                DeprecationWarning,
+                stacklevel=3,
+            )
+            return
+
+        started = time.perf_counter()
+        try:
+            expr = calling_expression(back=2)
+            recorder.call_sites[site] = code
+            if self.fixes.is_first(recorder, expr):
+                fix_attribute_access(
+                    expr, self.current_name, self.new_name, stacklevel=4
                 )
+        finally:
+            recorder.add_introspection_time(time.perf_counter() - started)
 
-                start = e.value.end_lineno, e.value.end_col_offset
-
-                tokens = expr.tokens
-                mytokens = [t for t in tokens if t.start >= start]
-
-                dot, name = mytokens[:2]
-
-                assert dot.string == "."
-                assert name.string == self.current_name
-
-                replace(name, self.new_name)
-
-    def __get__(self, obj, objtype=None):
+    def _record_get(self, obj, objtype=None):
         if obj is None:
             obj = objtype
 
-        self.__generic_fix()
+        frame = sys._getframe(1)
+        recorder = ChangeRecorder.current
+        site = (id(frame.f_code), frame.f_lasti, self.fixes)
+        if site not in recorder.call_sites:
+            self.__generic_fix(recorder, site, frame.f_code)
 
         return getattr(obj, self.new_name)
 
-    def __set__(self, obj, value):
-        self.__generic_fix()
+    def _record_set(self, obj, value):
+        frame = sys._getframe(1)
+        recorder = ChangeRecorder.current
+        site = (id(frame.f_code), frame.f_lasti, self.fixes)
+        if site not in recorder.call_sites:
+            self.__generic_fix(recorder, site, frame.f_code)
 
         return setattr(obj, self.new_name, value)
 
-    def __delete__(self, obj):
-        self.__generic_fix()
+    def _record_delete(self, obj):
+        frame = sys._getframe(1)
+        recorder = ChangeRecorder.current
+        site = (id(frame.f_code), frame.f_lasti, self.fixes)
+        if site not in recorder.call_sites:
+            self.__generic_fix(recorder, site, frame.f_code)
 
         delattr(obj, self.new_name)
+
+    def _alias_get(self, obj, objtype=None):
+        if obj is None:
+            obj = objtype
+        return getattr(obj, self.new_name)
+
+    def _alias_set(self, obj, value):
+        setattr(obj, self.new_name, value)
+
+    def _alias_delete(self, obj):
+        delattr(obj, self.new_name)
+
+    __get__ = _record_get
+    __set__ = _record_set
+    __delete__ = _record_delete
+
+    @classmethod
+    def _set_alias_mode(cls, alias):
+        """
+        exchanges the descriptor methods, which keeps the alias mode free of any checks
+        """
+        if alias:
+            cls.__get__ = cls._alias_get
+            cls.__set__ = cls._alias_set
+            cls.__delete__ = cls._alias_delete
+        else:
+            cls.__get__ = cls._record_get
+            cls.__set__ = cls._record_set
+            cls.__delete__ = cls._record_delete
@@ -1,90 +1,127 @@
-import ast
-import inspect
-import io
-import pathlib
-import tokenize
-from dataclasses import dataclass
-from functools import cached_property
-
+from __future__ import annotations
 
-@dataclass
-class code_offset:
-    line_offset: int
-    col_offset: int
+import pathlib
+import sys
+import time
+from typing import NamedTuple
+from typing import TYPE_CHECKING
 
+from ._rewrite_code import ChangeRecorder
 
-@dataclass
-class Token:
-    filename: pathlib.Path
-    lineno: int
-    end_lineno: int
-    col_offset: int
-    end_col_offset: int
-    type: object
-    string: str
+if TYPE_CHECKING:
+    import ast
 
-    @property
-    def start(self):
-        return (self.lineno, self.col_offset)
+    from ._source_cache import CachedSource
 
-    @property
-    def end(self):
-        return (self.end_lineno, self.end_col_offset)
+# imported with ast, executing and tokenize when the first call site is analysed
+_CachedSource = None
 
 
-@dataclass
-class lookup_result:
+class lookup_result(NamedTuple):
     filename: pathlib.Path
     ast_index: int
     code: str
-    _offset: code_offset
     expr: ast.AST
+    source: CachedSource
 
-    @cached_property
+    @property
     def tokens(self):
-        file = io.StringIO(self.code)
-        return [
-            Token(
-                filename=self.filename,
-                type=t.type,
-                string=t.string,
-                lineno=t.start[0] + self._offset.line_offset,
-                end_lineno=t.end[0] + self._offset.line_offset,
-                col_offset=t.start[1] + self._offset.col_offset,
-                end_col_offset=t.end[1] + self._offset.col_offset,
-            )
-            for t in tokenize.generate_tokens(file.readline)
-        ]
+        return self.source.tokens_of(self.expr)
 
     def dump(self):
+        import ast
+
         print(ast.dump(self.expr, include_attributes=True))
 
 
-import executing
+class FixIndex:
+    """
+    identifies the call sites and fixed expressions of one owner (a descriptor or function wrapper)
+    in the recorders.
+
+    Every recorder keeps its own call sites and fixed expressions (see `ChangeRecorder.call_sites`),
+    because recorders which are active at the same time (in different threads) have to record the
+    same call site.
+    The index does not reference its owner, which keeps the owner collectable.
+    """
+
+    __slots__ = ()
+
+    def is_first(self, recorder, expr):
+        fix_id = (self, expr.filename, expr.ast_index)
+        first = fix_id not in recorder.fixed
+        recorder.fixed.add(fix_id)
+        return first
 
 
 def calling_expression(back=1):
-    frame = inspect.currentframe().f_back
+    global _CachedSource
+    if _CachedSource is None:
+        from ._source_cache import CachedSource as _CachedSource
+
+    frame = sys._getframe(1)
 
     for _ in range(back):
         frame = frame.f_back
 
-    source_file = inspect.getfile(frame)
-    code = "".join(inspect.findsource(frame)[0])
+    stats = ChangeRecorder.current.stats
+    stats.calling_expression_calls += 1
+
+    load_time = stats.source_load_time
+    started = time.perf_counter()
+
+    node = None
+    if sys.version_info >= (3, 11):
+        source = _CachedSource.for_frame(frame)
+        node = source.node_at(frame.f_code, frame.f_lasti)
 
-    ex = executing.Source.executing(frame)
+    if node is None:
+        # instructions which are not supported by `node_at` and python < 3.11
+        ex = _CachedSource.executing(frame)
+        source = ex.source
+        node = ex.node
 
-    if not hasattr(ex.node, "ast_index"):
-        _orig_ast = ex.node
+        if node is None:
+            node = import_from_statement(source, frame)
+
+    # the loading of the source is measured separately
+    stats.executing_time += (
+        time.perf_counter() - started - (stats.source_load_time - load_time)
+    )
 
-        for i, code_node in enumerate(ast.walk(_orig_ast)):
-            code_node.ast_index = i
-            code_node.filename = source_file
+    if node is None:
+        # executing can not map every instruction to a node on python < 3.11
+        # (an AttributeError like in the versions which used `ex.node` directly)
+        raise AttributeError(
+            f"codecrumbs can not find the expression at {frame.f_code.co_filename}:{frame.f_lineno}"
+        )
 
     return lookup_result(
-        filename=pathlib.Path(source_file),
-        expr=ex.node,
-        ast_index=ex.node.ast_index,
-        code=code,
-        _offset=code_offset(0, 0),
+        filename=pathlib.Path(source.filename),
+        expr=node,
+        ast_index=source.node_index[id(node)],
+        code=source.text,
+        source=source,
     )
+
+
+def import_from_statement(source, frame):
+    """
+    returns the `from ... import ...` statement of the current IMPORT_FROM instruction.
+
+    A module `__getattr__` is called by IMPORT_FROM, which is not supported by `executing`.
+    """
+    import ast
+    from opcode import opmap
+
+    if frame.f_code.co_code[frame.f_lasti] != opmap["IMPORT_FROM"]:
+        return None
+
+    lineno = frame.f_lineno
+    for node in ast.walk(source.tree):
+        if (
+            isinstance(node, ast.ImportFrom)
+            and node.lineno <= lineno <= node.end_lineno
+        ):
+            return node
+    return None
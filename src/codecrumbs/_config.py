@@ -0,0 +1,82 @@
+import os
+import warnings
+
+# the descriptors and function wrappers only redirect to the new names
+alias_mode = False
+
+modes = ("record", "alias", "auto")
+
+
+def deprecation_warnings_ignored():
+    """
+    returns True if the active warning filters ignore every DeprecationWarning
+    """
+    for action, message, category, module, _ in warnings.filters:
+        if not issubclass(DeprecationWarning, category):
+            continue
+        if action != "ignore":
+            return False
+        if message is None and module is None:
+            return True
+    return False
+
+
+def configure(*, mode=None, source_cache_entries=None, source_cache_bytes=None):
+    """
+    Changes the runtime configuration of codecrumbs.
+
+    Arguments:
+        mode: `"record"` (the default) analyses every new call site of deprecated API,
+            emits a DeprecationWarning and records the fix.
+            `"alias"` only redirects to the new names without any warnings or analysis.
+            `"auto"` uses `"alias"` if the current warning filters ignore all DeprecationWarnings
+            and `"record"` otherwise (the filters are checked once when configure() is called).
+            The mode can also be set with the environment variable `CODECRUMBS_MODE`
+            (invalid values emit a RuntimeWarning and `"record"` is used).
+        source_cache_entries: maximum number of source files which are kept in memory
+        source_cache_bytes: maximum size of the source files which are kept in memory
+
+    codecrumbs keeps the source and the parsed AST of the files which use deprecated API.
+    The size of the source files is used to estimate the memory usage of the cache.
+    """
+    global alias_mode
+
+    if mode is not None:
+        if mode not in modes:
+            raise ValueError(f"mode has to be one of {modes}, not {mode!r}")
+
+        alias_mode = mode == "alias" or (
+            mode == "auto" and deprecation_warnings_ignored()
+        )
+
+        from ._attribute import RenameAttribute
+
+        RenameAttribute._set_alias_mode(alias_mode)
+
+    if source_cache_entries is not None or source_cache_bytes is not None:
+        from ._source_cache import source_cache
+
+        source_cache.configure(
+            max_entries=source_cache_entries, max_bytes=source_cache_bytes
+        )
+
+
+def configure_from_environment():
+    mode = os.environ.get("CODECRUMBS_MODE")
+    if mode:
+        if mode not in modes:
+            # a wrong environment variable should not break the import of codecrumbs
+            warnings.warn(
+                f'CODECRUMBS_MODE has to be one of {modes}, not {mode!r} (using "record")',
+                RuntimeWarning,
+            )
+            mode = "record"
+        configure(mode=mode)
+
+    # child process of `codecrumbs run` (see _shard.py)
+    if os.environ.get("CODECRUMBS_SHARD_DIR") and os.environ.get(
+        "CODECRUMBS_SHARD_PARENT"
+    ) != str(os.getpid()):
+        from ._shard import start_child_recording
+
+        start_child_recording()
@@ -0,0 +1,149 @@
+"""
+periodic flushing of the recorded changes for processes which run for a long time.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+from ._rewrite_code import ChangeRecorder
+
+
+class PeriodicFlusher:
+    """
+    writes the changes of a recorder from a background thread.
+
+    The changes are written every `interval` seconds (if it is not None), when
+    `max_pending` new replacements are recorded or when the process receives
+    `signum`. Nothing is written if there are no new replacements.
+
+    Arguments:
+        recorder: the recorder which is flushed
+        target: a `CrumbStore`, which gets only the new replacements,
+            or the path of a patch file, which is replaced with a patch of all replacements
+    """
+
+    def __init__(
+        self, recorder, target, *, interval=60.0, max_pending=None, signum=None
+    ):
+        self.recorder = recorder
+        self.target = target
+        self.interval = interval
+        self.max_pending = max_pending
+        self.signum = signum
+
+        # number of replacements per file which are already written
+        self._flushed: dict[Path, int] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="codecrumbs-flush", daemon=True
+        )
+        self._old_handler = None
+
+    def start(self):
+        if self.signum is not None:
+            self._old_handler = signal.signal(self.signum, self._handle_signal)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        if self.signum is not None:
+            signal.signal(self.signum, self._old_handler)
+
+    def _handle_signal(self, signum, frame):
+        # the signal handler runs in the main thread and only wakes up the flush thread
+        self._wake.set()
+
+    def pending(self):
+        """
+        returns the number of replacements which are not written yet
+        """
+        return sum(
+            len(file) - self._flushed.get(filename, 0)
+            for filename, file in list(self.recorder._source_files.items())
+        )
+
+    def _run(self):
+        interval = self.interval if self.interval is not None else float("inf")
+        poll = self.interval
+        if self.max_pending is not None:
+            poll = min(interval, 1.0)
+
+        next_flush = time.monotonic() + interval
+        while not self._stop.is_set():
+            woken = self._wake.wait(poll)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+
+            now = time.monotonic()
+            if (
+                woken
+                or now >= next_flush
+                or (self.max_pending is not None and self.pending() >= self.max_pending)
+            ):
+                next_flush = now + interval
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"codecrumbs: flush failed: {e!r}", file=sys.stderr)
+
+    def _snapshot(self, only_new):
+        """
+        returns a recorder with a copy of the (new) replacements
+        """
+        data = []
+        stats = {}
+        counts = {}
+
+        # the lists are copied, because they are changed by the recording thread
+        for filename, file in list(self.recorder._source_files.items()):
+            replacements = list(file.replacements)
+            counts[filename] = len(replacements)
+            if only_new:
+                replacements = replacements[self._flushed.get(filename, 0) :]
+            if replacements:
+                data.append(
+                    (
+                        filename,
+                        [(*r.start, *r.end, r.text, r.change_id) for r in replacements],
+                    )
+                )
+                stats[filename] = file.stat
+
+        snapshot = ChangeRecorder()
+        snapshot.load(data)
+        for filename, stat in stats.items():
+            # the stat of the recorded version, not of the current one
+            snapshot.get_source_file(filename).stat = stat
+
+        return snapshot, counts
+
+    def flush(self):
+        """
+        writes the new replacements (this is also called by the flush thread)
+        """
+        if self.pending() == 0:
+            return
+
+        if isinstance(self.target, (str, os.PathLike)):
+            snapshot, counts = self._snapshot(only_new=False)
+            path = Path(self.target)
+            tmp = path.with_name(f".{path.name}.tmp")
+            with open(tmp, "w") as patch:
+                for line in snapshot.generate_patch(path.parent):
+                    patch.write(line)
+            os.replace(tmp, path)
+        else:
+            snapshot, counts = self._snapshot(only_new=True)
+            self.target.add(snapshot)
+
+        self._flushed = counts
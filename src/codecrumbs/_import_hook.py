@@ -0,0 +1,171 @@
+"""
+import hook, which renames the deprecated code of modules while they are imported.
+
+The renamed code does not use the deprecated attributes and arguments,
+which means that there is no runtime overhead for these modules.
+The files on disk are not changed.
+"""
+from __future__ import annotations
+
+import ast
+import hashlib
+import importlib
+import json
+import sys
+from importlib.abc import MetaPathFinder
+from importlib.machinery import PathFinder
+from importlib.machinery import SourceFileLoader
+
+from ._static import collect_renamings
+from ._static import ImportedNames
+from ._static import imports_module
+from ._static import in_modules
+from ._static import renamed_attribute
+
+
+class RenameTransformer(ast.NodeTransformer):
+    def __init__(self, renamings, names):
+        self.renamings = renamings
+        self.names = names
+        self.arguments = renamings["arguments"]
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        new_name = renamed_attribute(self.renamings, self.names, node.value, node.attr)
+        if new_name is not None:
+            node.attr = new_name
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+
+        if (
+            isinstance(func, ast.Name)
+            and func.id in ("getattr", "hasattr", "setattr", "delattr")
+            and len(node.args) >= 2
+            and isinstance(node.args[1], ast.Constant)
+            and isinstance(node.args[1].value, str)
+        ):
+            new_name = renamed_attribute(
+                self.renamings, self.names, node.args[0], node.args[1].value
+            )
+            if new_name is not None:
+                node.args[1].value = new_name
+
+        if isinstance(func, ast.Name):
+            renamed_args = self.arguments.get(func.id)
+        elif isinstance(func, ast.Attribute):
+            # the attribute is already renamed
+            renamed_args = self.arguments.get(func.attr)
+        else:
+            renamed_args = None
+
+        if renamed_args:
+            used = {arg.arg for arg in node.keywords}
+            for arg in node.keywords:
+                new_name = renamed_args.get(arg.arg)
+                # keep the call unchanged if both names are used (TypeError at runtime)
+                if new_name is not None and new_name not in used:
+                    arg.arg = new_name
+
+        return node
+
+
+class RenamingLoader(SourceFileLoader):
+    """
+    loads a source file with the renamings applied.
+
+    The bytecode is cached in `__pycache__` with a tag which contains a hash of
+    the renamings, the normal `.pyc` file is not used.
+    """
+
+    def __init__(self, fullname, path, renamings, tag):
+        super().__init__(fullname, path)
+        self.renamings = renamings
+        self.tag = tag
+
+    def _cache_path(self, path):
+        if path.endswith(".pyc"):
+            return f"{path[:-4]}.{self.tag}.pyc"
+        return path
+
+    def get_data(self, path):
+        return super().get_data(self._cache_path(path))
+
+    def set_data(self, path, data, *, _mode=0o666):
+        super().set_data(self._cache_path(path), data, _mode=_mode)
+
+    def source_to_code(self, data, path, *, _optimize=-1):
+        tree = ast.parse(data, path)
+        if imports_module(tree, self.renamings["modules"]):
+            tree = ast.fix_missing_locations(
+                RenameTransformer(self.renamings, ImportedNames(tree)).visit(tree)
+            )
+        return compile(tree, path, "exec", dont_inherit=True, optimize=_optimize)
+
+
+class RenamingFinder(MetaPathFinder):
+    def __init__(self, libraries, modules, attributes=()):
+        self.modules = modules
+        self.renamings = collect_renamings(libraries, attributes)
+        renamings_hash = hashlib.sha256(
+            json.dumps(self.renamings, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        self.tag = f"codecrumbs-{renamings_hash}"
+
+    def find_spec(self, fullname, path, target=None):
+        if not in_modules(fullname, self.modules):
+            return None
+
+        spec = PathFinder.find_spec(fullname, path)
+        if spec is None or not isinstance(spec.loader, SourceFileLoader):
+            return spec
+
+        spec.loader = RenamingLoader(fullname, spec.origin, self.renamings, self.tag)
+        return spec
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+def install_import_hook(libraries, modules, *, attributes=()):
+    """
+    renames the deprecated code in `modules` (and their submodules) when they are imported.
+
+    The renamings are collected from the `libraries`, which are imported first.
+    The modules which are already imported are not changed.
+
+    The types of the objects are not known before the code runs.
+    Attributes are therefore only renamed if the object is an imported class or
+    module of the library (`mylib.Class.old` or `mylib.old`).
+    The names in `attributes` are renamed for every object:
+
+    ```python
+    # renames a.old for every object a
+    install_import_hook("mylib", ["myapp"], attributes=["old"])
+    ```
+
+    !!! warning
+        The attributes of other objects are renamed too if they have the same name
+        (`namedtuple("Other", "old")(5).old` raises an AttributeError after the renaming).
+        Use only names which are unique in the renamed modules.
+
+    Arguments:
+        libraries: names of the modules which define the renamings
+        modules: names of the modules which should be renamed
+        attributes: old attribute names which are renamed for every object
+
+    Returns:
+        the finder, which can be removed with `finder.uninstall()`
+    """
+    libraries = [libraries] if isinstance(libraries, str) else list(libraries)
+    modules = [modules] if isinstance(modules, str) else list(modules)
+
+    for library in libraries:
+        importlib.import_module(library)
+
+    finder = RenamingFinder(libraries, modules, attributes)
+    sys.meta_path.insert(0, finder)
+    return finder
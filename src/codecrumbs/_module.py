@@ -0,0 +1,137 @@
+import sys
+import time
+import warnings
+import weakref
+
+from . import _config
+from ._attribute import fix_attribute_access
+from ._calling_expression import calling_expression
+from ._calling_expression import FixIndex
+from ._rewrite_code import ChangeRecorder
+from ._rewrite_code import replace
+
+
+def globals_renamed(module_name, renamings, *, since=None):
+    """
+    Specifies that functions, classes or other global names of a module were renamed.
+
+    The returned function has to be used as the `__getattr__` of the module (PEP 562):
+
+    ```python
+    # mylib/__init__.py
+    import codecrumbs
+
+
+    def new_function():
+        ...
+
+
+    __getattr__ = codecrumbs.globals_renamed(__name__, {"old_function": "new_function"})
+    ```
+
+    The old names are not defined in the module, which means that python calls
+    `__getattr__` only for them and the other names are found without calling it.
+    (python >= 3.11 does not specialize `module.name` for modules with a `__getattr__`,
+    which makes these accesses a few nanoseconds slower.
+    `from module import name` and the global names inside the module are not affected.)
+
+    `mylib.old_function` is renamed to `mylib.new_function` and
+    `from mylib import old_function` is renamed to `from mylib import new_function as old_function`.
+
+    Arguments:
+        module_name: the `__name__` of the module
+        renamings: a dict which maps the old names to the new names
+    """
+    module_renamings = {
+        old_name: RenameGlobal(module_name, old_name, new_name, since)
+        for old_name, new_name in renamings.items()
+    }
+
+    def __getattr__(name):
+        renaming = module_renamings.get(name)
+        if renaming is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        return renaming.get()
+
+    return __getattr__
+
+
+class RenameGlobal:
+    # all renamed global names, which are used by `codecrumbs scan`
+    registry: "weakref.WeakSet[RenameGlobal]" = weakref.WeakSet()
+
+    def __init__(self, module_name, current_name, new_name, since):
+        self.module_name = module_name
+        self.current_name = current_name
+        self.new_name = new_name
+        self.fixes = FixIndex()
+        self.since_version = since
+        RenameGlobal.registry.add(self)
+
+    def get(self):
+        if not _config.alias_mode:
+            # the caller of the module __getattr__
+            frame = sys._getframe(2)
+            recorder = ChangeRecorder.current
+            site = (id(frame.f_code), frame.f_lasti, self.fixes)
+            if (
+                site not in recorder.call_sites
+                and not frame.f_code.co_filename.startswith("<frozen importlib")
+            ):
+                # `from package import name` checks the name with hasattr() in importlib first
+                self.__generic_fix(recorder, site, frame.f_code)
+
+        return getattr(sys.modules[self.module_name], self.new_name)
+
+    def __generic_fix(self, recorder, site, code):
+        if not recorder.sample():
+            # the kind of access is unknown without the analysis of the call site
+            warnings.warn(
+                f'"{self.module_name}.{self.current_name}" should be replaced with "{self.module_name}.{self.new_name}" (fixable with codecrumbs)',
+                DeprecationWarning,
+                stacklevel=4,
+            )
+            return
+
+        started = time.perf_counter()
+        try:
+            expr = calling_expression(back=3)
+            recorder.call_sites[site] = code
+            if self.fixes.is_first(recorder, expr):
+                self.__fix_expression(expr)
+        finally:
+            recorder.add_introspection_time(time.perf_counter() - started)
+
+    def __fix_expression(self, expr):
+        import ast
+
+        if not isinstance(expr.expr, ast.ImportFrom):
+            # module.name or getattr(module, "name")
+            fix_attribute_access(expr, self.current_name, self.new_name, stacklevel=6)
+            return
+
+        warnings.warn(
+            f'"from {self.module_name} import {self.current_name}" should be replaced with "from {self.module_name} import {self.new_name}" (fixable with codecrumbs)',
+            DeprecationWarning,
+            stacklevel=5,
+        )
+
+        node = expr.expr
+        source = expr.source
+        tokens = expr.tokens.names_and_ops_between(
+            source.char_position(node.lineno, node.col_offset),
+            source.char_position(node.end_lineno, node.end_col_offset),
+        )
+
+        # the imported names and their aliases follow the first `import`
+        names = tokens[[t.string for t in tokens].index("import") + 1 :]
+        for i, name in enumerate(names):
+            if name.string != self.current_name or (
+                i > 0 and names[i - 1].string == "as"
+            ):
+                continue
+            if i + 1 < len(names) and names[i + 1].string == "as":
+                replace(name, self.new_name)
+            else:
+                # the old name is still used in the rest of the file
+                replace(name, f"{self.new_name} as {self.current_name}")
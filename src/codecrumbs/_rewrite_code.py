@@ -1,20 +1,27 @@
 from __future__ import annotations
 
+import bisect
 import contextlib
+import contextvars
+import itertools
+import os
 import pathlib
-import subprocess as sp
+import re
+import sys
+import threading
+import time
 from collections import defaultdict
-from dataclasses import dataclass
+from typing import NamedTuple
 
-try:
-    from itertools import pairwise
-except ImportError:
-    from itertools import tee
+from ._stats import Stats
 
-    def pairwise(iterable):  # type: ignore
-        a, b = tee(iterable)
-        next(b, None)
-        return zip(a, b)
+
+def file_stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
 
 # copied from pathlib to support python < 3.9
@@ -27,63 +34,263 @@ def is_relative_to(path, *other):
         return False
 
 
-@dataclass(order=True)
-class Replacement:
+class Replacement(NamedTuple):
     start: tuple[int, int]
     end: tuple[int, int]
     text: str
     change_id: int = 0
 
 
+class Conflict(NamedTuple):
+    change_id: int
+    other_change_id: int
+
+
 class Change:
-    _next_change_id = 0
+    # next() of itertools.count is atomic, the ids are unique across threads
+    _change_ids = itertools.count()
 
     def __init__(self):
-        self.change_id = self._next_change_id
-        type(self)._next_change_id += 1
+        self.change_id = next(Change._change_ids)
 
     def replace(self, node, new_contend):
+        record_replacement(node, new_contend, self.change_id)
 
-        # remove this
-        if not isinstance(new_contend, str):
-            new_contend = repr(new_contend)
 
-        start = node.start if hasattr(node, "start") else (node.lineno, node.col_offset)
-        end = (
-            node.end if hasattr(node, "end") else (node.end_lineno, node.end_col_offset)
-        )
+def record_replacement(node, new_contend, change_id):
+    # remove this
+    if not isinstance(new_contend, str):
+        new_contend = repr(new_contend)
 
-        get_source_file(node.filename).replacements.append(
-            Replacement(
-                start=start, end=end, text=new_contend, change_id=self.change_id
-            )
-        )
+    if hasattr(node, "start"):
+        start, end = node.start, node.end
+    else:
+        # the col_offsets of ast nodes are utf-8 byte offsets
+        from ._source_cache import char_range
+
+        start, end = char_range(node)
+
+    ChangeRecorder.current.record(node.filename, start, end, new_contend, change_id)
 
 
 class SourceFile:
     def __init__(self, filename):
-        self.replacements = []
+        # (start_line, start_col, end_line, end_col, text) -> change_id
+        # identical replacements are stored once
+        self._replacements: dict[tuple, int] = {}
         self.filename = filename
+        self.stat = file_stat(filename)
+        # (number of replacements, result of resolve_replacements())
+        self._resolved: tuple | None = None
+        # the source code, which is only read to merge overlapping replacements
+        self._code: str | None = None
+        self._starts: list[int] = []
+
+    def add(self, start, end, text, change_id):
+        """
+        adds a replacement, which is ignored if the same replacement already exists
+        """
+        self._replacements.setdefault((*start, *end, text), change_id)
+
+    def __len__(self):
+        return len(self._replacements)
+
+    @property
+    def replacements(self):
+        """
+        the replacements in the order in which they were added
+        """
+        return [
+            Replacement((key[0], key[1]), (key[2], key[3]), key[4], change_id)
+            for key, change_id in list(self._replacements.items())
+        ]
+
+    @replacements.setter
+    def replacements(self, replacements):
+        self._replacements = {}
+        self._resolved = None
+        for r in replacements:
+            self.add(r.start, r.end, r.text, r.change_id)
 
     def rewrite(self):
+        """
+        writes the new code to a temporary file which replaces the source file.
+
+        Symlinks are resolved and keep pointing to the fixed file.
+        Files with hardlinks are overwritten in place, because a new file would
+        only replace one of the links.
+
+        Returns the reason if the file could not be fixed.
+        """
+        if file_stat(self.filename) != self.stat:
+            return "the file was changed after the fixes were recorded"
 
         new_code = self.new_code()
 
         if new_code is not None:
+            import shutil
+            import tempfile
 
-            with open(self.filename, "bw") as code:
-                code.write(new_code.encode())
+            target = pathlib.Path(os.path.realpath(self.filename))
 
-    def new_code(self):
-        replacements = list(self.replacements)
-        replacements.sort()
+            if os.stat(target).st_nlink > 1:
+                with open(target, "r+b") as code:
+                    if file_stat(self.filename) != self.stat:
+                        return "the file was changed after the fixes were recorded"
+                    code.write(new_code.encode())
+                    code.truncate()
+                return None
 
-        for r in replacements:
+            fd, tmp_name = tempfile.mkstemp(
+                dir=target.parent, prefix=f".{target.name}."
+            )
+            try:
+                with os.fdopen(fd, "bw") as code:
+                    code.write(new_code.encode())
+                    code.flush()
+                    os.fsync(code.fileno())
+                shutil.copymode(target, tmp_name)
+
+                if file_stat(self.filename) != self.stat:
+                    os.remove(tmp_name)
+                    return "the file was changed after the fixes were recorded"
+
+                os.replace(tmp_name, target)
+            except BaseException:
+                if os.path.exists(tmp_name):
+                    os.remove(tmp_name)
+                raise
+
+        return None
+
+    def resolve_replacements(self):
+        """
+        returns the replacements which can be applied and the conflicts
+        between the recorded changes.
+
+        Overlapping replacements are merged if they produce the same code
+        (identical or nested replacements for example).
+        All replacements of a change are skipped if one of them overlaps with
+        an incompatible replacement of a change which was recorded earlier.
+
+        The result is cached until new replacements are added.
+        """
+        if self._resolved is not None and self._resolved[0] == len(self._replacements):
+            return self._resolved[1]
+
+        changes = defaultdict(list)
+        for r in self.replacements:
             assert r.start < r.end
+            changes[r.change_id].append(r)
+
+        # accepted replacements, sorted by position and without overlaps
+        accepted: list[Replacement] = []
+        accepted_starts: list[tuple[int, int]] = []
+        conflicts = []
+
+        for change_id in sorted(changes):
+            # the replacements of this change, merged with the overlapping ones
+            new: list[Replacement] = []
+            # the accepted replacements which are merged into the new ones
+            merged = set()
+            conflict = None
+
+            for r in sorted(changes[change_id]):
+                if new and new[-1].end > r.start:
+                    m = self._merge([new[-1]], r)
+                    if m is None:
+                        conflict = change_id
+                        break
+                    new.pop()
+                    r = m
+
+                i = bisect.bisect_left(accepted_starts, r.start)
+                if i > 0 and accepted[i - 1].end > r.start:
+                    i -= 1
+                j = i
+                while j < len(accepted) and accepted[j].start < r.end:
+                    j += 1
+
+                if i < j:
+                    m = self._merge(accepted[i:j], r)
+                    if m is None:
+                        conflict = accepted[i].change_id
+                        break
+                    merged.update(accepted[i:j])
+                    r = m
+
+                new.append(r)
+
+            if conflict is not None:
+                conflicts.append(Conflict(change_id, conflict))
+                continue
+
+            for r in merged:
+                i = bisect.bisect_left(accepted_starts, r.start)
+                del accepted[i]
+                del accepted_starts[i]
+
+            for r in new:
+                i = bisect.bisect_left(accepted_starts, r.start)
+                accepted.insert(i, r)
+                accepted_starts.insert(i, r.start)
+
+        self._code = None
+        self._resolved = (len(self._replacements), (accepted, conflicts))
+        return accepted, conflicts
+
+    def _merge(self, replacements, r):
+        """
+        returns one replacement for r and the overlapping replacements
+        (sorted and without overlaps), or None if they produce different code.
+
+        The merged replacement belongs to the change of the first replacement.
+        """
+        first = replacements[0]
+        if len(replacements) == 1 and (first.start, first.end) == (r.start, r.end):
+            return first if first.text == r.text else None
+
+        if self._code is None:
+            try:
+                with open(self.filename, newline="") as code:
+                    self._code = code.read()
+            except OSError:
+                return None
+            self._starts = line_starts(self._code)
+
+        code = self._code
+
+        def offset(pos):
+            line, col = pos
+            return self._starts[line - 1] + col
+
+        start = min(first.start, r.start)
+        end = max(replacements[-1].end, r.end)
+
+        def apply(replacements):
+            # the code between start and end with the replacements
+            parts = []
+            pos = offset(start)
+            for x in replacements:
+                parts.append(code[pos : offset(x.start)])
+                parts.append(x.text)
+                pos = offset(x.end)
+            parts.append(code[pos : offset(end)])
+            return "".join(parts)
+
+        text = apply(replacements)
+        if text != apply([r]):
+            return None
+        return Replacement(start, end, text, first.change_id)
+
+    def report_conflicts(self):
+        for conflict in self.resolve_replacements()[1]:
+            print(
+                f"{self.filename}: skip change {conflict.change_id}, because it overlaps with change {conflict.other_change_id}"
+            )
 
-        # TODO check for overlapping replacements
-        for lhs, rhs in pairwise(replacements):
-            assert lhs.end <= rhs.start
+    def new_code(self):
+        replacements, _ = self.resolve_replacements()
 
         if not replacements:
             return
@@ -91,123 +298,401 @@ class SourceFile:
         with open(self.filename, newline="") as code:
             code = code.read()
 
-        new_code = ""
+        starts = line_starts(code)
+
+        def offset(pos):
+            line, col = pos
+            return starts[line - 1] + col
+
+        parts = []
         last_i = 0
-        add_end = True
-
-        for pos, i, c in code_stream(code):
-            if replacements:
-                r = replacements[0]
-                if pos == r.start:
-                    new_code += code[last_i:i] + r.text
-                    add_end = False
-                if pos == r.end:
-                    last_i = i
-                    add_end = True
-                    replacements.pop(0)
-            else:
-                break
+        for r in replacements:
+            parts.append(code[last_i : offset(r.start)])
+            parts.append(r.text)
+            last_i = offset(r.end)
+        parts.append(code[last_i:])
 
-        if add_end:
-            new_code += code[last_i:]
+        return "".join(parts)
 
-        return new_code
+    def generate_patch(self, basedir, context=3):
+        """
+        yields the lines of a unified diff (like `difflib.unified_diff`).
 
-    def generate_patch(self, basedir):
+        The hunks are created from the positions of the replacements,
+        the old and the new code are not compared.
+        """
+        replacements, _ = self.resolve_replacements()
+
+        if not replacements:
+            return
 
         filename = self.filename
         if is_relative_to(filename, basedir):
             filename = filename.relative_to(basedir)
 
         with open(self.filename, newline="") as code:
-            old_code = code.read().splitlines(keepends=True)
+            code = code.read()
 
-        new_code = self.new_code().splitlines(keepends=True)
+        starts = line_starts(code)
+        lines = split_lines(code, starts)
+
+        # (first changed line, end of the changed lines, new lines) with 0-based line numbers
+        changes = []
+        i = 0
+        while i < len(replacements):
+            first = replacements[i].start[0]
+            last = replacements[i].end[0]
+            j = i + 1
+            while j < len(replacements) and replacements[j].start[0] <= last:
+                last = max(last, replacements[j].end[0])
+                j += 1
+            # a replacement can end after the last line (line n+1, column 0)
+            last = min(last, len(lines))
+
+            block_start = starts[first - 1]
+            old_text = "".join(lines[first - 1 : last])
+            parts = []
+            pos = block_start
+            for r in replacements[i:j]:
+                start = starts[r.start[0] - 1] + r.start[1]
+                parts.append(code[pos:start])
+                parts.append(r.text)
+                pos = starts[r.end[0] - 1] + r.end[1]
+            parts.append(code[pos : block_start + len(old_text)])
+
+            new_text = "".join(parts)
+            new_lines = split_lines(new_text, line_starts(new_text))
+            old_lines = lines[first - 1 : last]
+
+            # unchanged lines at the beginning and the end are context lines
+            prefix = 0
+            while (
+                prefix < min(len(old_lines), len(new_lines))
+                and old_lines[prefix] == new_lines[prefix]
+            ):
+                prefix += 1
+            suffix = 0
+            while (
+                suffix < min(len(old_lines), len(new_lines)) - prefix
+                and old_lines[-1 - suffix] == new_lines[-1 - suffix]
+            ):
+                suffix += 1
+
+            if prefix + suffix < max(len(old_lines), len(new_lines)):
+                change = (
+                    first - 1 + prefix,
+                    last - suffix,
+                    new_lines[prefix : len(new_lines) - suffix],
+                )
+                if changes and changes[-1][1] == change[0]:
+                    # adjacent lines are one change (like in difflib)
+                    start, _, previous_lines = changes.pop()
+                    change = (start, change[1], previous_lines + change[2])
+                changes.append(change)
+            i = j
+
+        if not changes:
+            return
 
-        import difflib
-
-        yield from difflib.unified_diff(
-            old_code, new_code, fromfile=str(filename), tofile=str(filename)
-        )
+        yield f"--- {filename}\n"
+        yield f"+++ {filename}\n"
+        yield from unified_hunks(lines, changes, context)
 
 
 def get_source_file(filename):
-    filename = pathlib.Path(filename)
+    return ChangeRecorder.current.get_source_file(filename)
+
+
+_current_recorder: contextvars.ContextVar[ChangeRecorder] = contextvars.ContextVar(
+    "codecrumbs_recorder"
+)
+
 
-    if filename not in ChangeRecorder.current._source_files:
-        ChangeRecorder.current._source_files[filename] = SourceFile(filename)
+class _CurrentRecorder:
+    """
+    `ChangeRecorder.current`: the recorder of the current context or the default recorder
+    """
 
-    return ChangeRecorder.current._source_files[filename]
+    def __get__(self, obj, objtype=None):
+        return _current_recorder.get(ChangeRecorder.default)
 
 
 def replace(node, new_contend):
-    Change().replace(node, new_contend)
+    # a change with one replacement needs no Change object
+    record_replacement(node, new_contend, next(Change._change_ids))
 
 
 class ChangeRecorder:
-    current: ChangeRecorder | None = None
+    """
+    records the changes for the deprecated code which is used while the recorder is active.
+
+    The time which is spent to analyse new call sites can be limited for
+    production use:
+
+    Arguments:
+        max_sites_per_second: maximum number of new call sites which are analysed per second
+        max_introspection_time: total time in seconds which can be spent to analyse call sites
+
+    Call sites which are not analysed because of these limits only emit the warning.
+    Every such access is counted in `skipped_hits` (a site can be skipped more than once).
+
+    The overhead of codecrumbs is measured in `stats` and can be shown with `profile_report()`.
+
+    The active recorder is stored in a context variable (see `activate()`),
+    which keeps the recorders of threads and asyncio tasks apart.
+    """
+
+    current = _CurrentRecorder()
+
+    # the recorder which is used if no recorder is activated in the current context
+    default: ChangeRecorder | None = None
+
+    def __init__(self, *, max_sites_per_second=None, max_introspection_time=None):
+
+        self._files: dict[pathlib.Path, SourceFile] = {}
+        self._lock = threading.Lock()
+
+        # every thread appends its replacements to its own buffer,
+        # the buffers are merged when the replacements are used
+        self._local = threading.local()
+        self._buffers: list[list] = []
+        # the filenames of the call sites and their paths
+        self._paths: dict[str, pathlib.Path] = {}
+
+        self.max_sites_per_second = max_sites_per_second
+        self.max_introspection_time = max_introspection_time
+        self.introspection_time = 0.0
+        self.skipped_hits = 0
+        self._window_start = 0.0
+        self._window_sites = 0
+        self.stats = Stats()
+
+        # the call sites which are already analysed by this recorder:
+        # (id(code), lasti, fix_index) -> code
+        # (the code keeps its id unique, code objects can not be keys,
+        # because equal code from different files compares equal)
+        self.call_sites: dict = {}
+        # (fix_index, filename, ast_index) of the fixed expressions
+        self.fixed: set = set()
+
+    def sample(self):
+        """
+        returns True if the next new call site should be analysed
+        """
+        if self.max_introspection_time is not None:
+            if self.introspection_time >= self.max_introspection_time:
+                self.skipped_hits += 1
+                return False
+
+        if self.max_sites_per_second is not None:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_sites = 0
+            if self._window_sites >= self.max_sites_per_second:
+                self.skipped_hits += 1
+                return False
+            self._window_sites += 1
 
-    def __init__(self):
+        return True
 
-        self._source_files = defaultdict(SourceFile)
+    def add_introspection_time(self, duration):
+        self.introspection_time += duration
 
     @contextlib.contextmanager
-    def activate(self):
-        old_recorder = ChangeRecorder.current
-        ChangeRecorder.current = self
-        yield self
-        ChangeRecorder.current = old_recorder
+    def activate(self, *, all_threads=False):
+        """
+        records the changes of the current context (thread or asyncio task) with this recorder.
+
+        Threads start with an empty context. `all_threads=True` makes this recorder
+        also the default for all contexts which have no active recorder.
+        """
+        token = _current_recorder.set(self)
+        if all_threads:
+            old_default = ChangeRecorder.default
+            ChangeRecorder.default = self
+        try:
+            yield self
+        finally:
+            if all_threads:
+                ChangeRecorder.default = old_default
+            _current_recorder.reset(token)
+
+    def record(self, filename, start, end, text, change_id):
+        """
+        adds a replacement without locking (it is merged later)
+        """
+        path = self._paths.get(filename)
+        if path is None:
+            path = self._paths[filename] = pathlib.Path(filename)
+        if path not in self._files:
+            # the stat of the file is taken when the first change is recorded
+            with self._lock:
+                self._get_source_file(path)
+
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = []
+            with self._lock:
+                self._buffers.append(buffer)
+        # equal texts (the new names) are stored only once
+        buffer.append((path, start, end, sys.intern(text), change_id))
+        if len(buffer) >= 1024:
+            # duplicates are removed when the buffer is merged
+            self._merge_buffers()
+
+    def _merge_buffers(self):
+        with self._lock:
+            for buffer in self._buffers:
+                n = len(buffer)
+                if not n:
+                    continue
+                items = buffer[:n]
+                # the recording thread can append new items in the mean time
+                del buffer[:n]
+                for path, start, end, text, change_id in items:
+                    self._files[path].add(start, end, text, change_id)
+
+    @property
+    def _source_files(self):
+        self._merge_buffers()
+        return self._files
 
     def num_fixes(self):
         changes = set()
         for file in self._source_files.values():
-            changes.update(change.change_id for change in file.replacements)
+            changes.update(file._replacements.values())
         return len(changes)
 
-    def fix_all(self, *, check_git=True):
-        for file in self._source_files.values():
-            filename = file.filename
-            if check_git:
-                if (
-                    sp.run(
-                        ["git", "ls-files", "--error-unmatch", str(filename.name)],
-                        cwd=filename.parent,
-                        stdout=sp.DEVNULL,
-                    ).returncode
-                    != 0
-                ):
-                    print(
-                        f"{filename}: skip fixing, because the file is not in a git repository"
-                    )
-                    continue
+    def num_replacements(self):
+        return sum(len(file) for file in self._source_files.values())
+
+    def memory_usage(self):
+        """
+        returns an estimation of the memory in bytes which is used by the recorded changes
+        """
+        from ._stats import deep_sizeof
+
+        return deep_sizeof(self._source_files)
+
+    def profile_report(self):
+        """
+        returns a summary of the overhead of codecrumbs as text
+        """
+        from ._source_cache import source_cache
+        from ._stats import format_size
+
+        stats = self.stats
+        lines = [
+            f"analysed call sites: {stats.calling_expression_calls} (skipped hits: {self.skipped_hits})",
+            f"call site analysis: {self.introspection_time:.3f}s",
+            f"  executing: {stats.executing_time:.3f}s",
+            f"  source loading: {stats.source_load_time:.3f}s",
+            f"  tokenize: {stats.tokenize_time:.3f}s",
+        ]
+
+        hit_rate = stats.source_cache_hit_rate
+        if hit_rate is not None:
+            lines.append(
+                f"source cache: {hit_rate:.0%} hits ({stats.source_cache_hits} hits, {stats.source_cache_misses} misses)"
+            )
 
-                if (
-                    sp.run(
-                        ["git", "diff", "--quiet", str(filename.name)],
-                        cwd=filename.parent,
-                        stdout=sp.DEVNULL,
-                    ).returncode
-                    != 0
-                ):
-                    print(
-                        f"{filename}: skip fixing, because the file has unstaged changes"
-                    )
+        lines += [
+            f"replacements: {self.num_replacements()} for {self.num_fixes()} fixes in {len(self._source_files)} files",
+            f"recorder memory: {format_size(self.memory_usage())}",
+            f"source cache memory: {format_size(source_cache.size)} ({len(source_cache)} files)",
+        ]
+        if stats.traced_memory is not None:
+            lines.append(f"traced memory: {format_size(stats.traced_memory)}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """
+        returns the recorded replacements as plain lists and tuples,
+        which can be serialized and loaded into another recorder with `load()`.
+        """
+        return [
+            (
+                str(file.filename),
+                [(*r.start, *r.end, r.text, r.change_id) for r in file.replacements],
+            )
+            for file in self._source_files.values()
+        ]
+
+    def load(self, data):
+        """
+        adds the replacements from `dump()` of another recorder.
+
+        The changes get new change ids and identical replacements are skipped.
+        """
+        change_ids: dict[int, int] = {}
+        for filename, replacements in data:
+            file = self.get_source_file(filename)
+            for (
+                start_line,
+                start_col,
+                end_line,
+                end_col,
+                text,
+                change_id,
+            ) in replacements:
+                key = (start_line, start_col, end_line, end_col, sys.intern(text))
+                if key in file._replacements:
                     continue
+                if change_id not in change_ids:
+                    change_ids[change_id] = next(Change._change_ids)
+                file._replacements[key] = change_ids[change_id]
+
+    def get_source_file(self, filename):
+        self._merge_buffers()
+        with self._lock:
+            return self._get_source_file(filename)
+
+    def _get_source_file(self, filename):
+        # the caller holds the lock
+        filename = pathlib.Path(filename)
+
+        file = self._files.get(filename)
+        if file is None:
+            file = self._files[filename] = SourceFile(filename)
+        return file
+
+    def fix_all(self, *, check_git=True, max_workers=None):
+        """
+        fixes all files with the recorded changes.
+
+        The files are written in a thread pool with `max_workers` threads,
+        because writing and syncing the files releases the GIL.
+        """
+        # the call sites are recorded again after the fix
+        self.call_sites.clear()
+        self.fixed.clear()
+        files = list(self._source_files.values())
+
+        skip_reasons = {}
+        if check_git:
+            skip_reasons = git_skip_reasons([file.filename for file in files])
+
+        for file in files:
+            if file.filename in skip_reasons:
+                print(
+                    f"{file.filename}: skip fixing, because {skip_reasons[file.filename]}"
+                )
+            else:
+                file.report_conflicts()
 
-                if (
-                    sp.run(
-                        ["git", "check-ignore", "--quiet", str(filename.name)],
-                        cwd=filename.parent,
-                        stdout=sp.DEVNULL,
-                    ).returncode
-                    == 0
-                ):
-                    print(
-                        f"{filename}: skip fixing, because the file is ignored by git"
-                    )
-                    continue
+        files = [file for file in files if file.filename not in skip_reasons]
 
-            file.rewrite()
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            reasons = list(pool.map(SourceFile.rewrite, files))
+
+        for file, reason in zip(files, reasons):
+            if reason is not None:
+                print(f"{file.filename}: skip fixing, because {reason}")
 
     def generate_patchfile(self, filename):
         with open(filename, "w") as patch:
@@ -215,33 +700,164 @@ class ChangeRecorder:
                 patch.write(line)
 
     def generate_patch(self, basedir):
-        for file in self._source_files.values():
-            if is_relative_to(file.filename, basedir):
-                yield from file.generate_patch(basedir)
+        """
+        yields the lines of the patch file by file.
+        """
+        files = [
+            file
+            for file in self._source_files.values()
+            if is_relative_to(file.filename, basedir)
+        ]
+
+        for file in files:
+            file.report_conflicts()
+
+        for file in files:
+            yield from file.generate_patch(basedir)
+
+
+def find_git_root(directory, cache):
+    """
+    returns the top level directory of the git repository which contains `directory`
+    """
+    if directory not in cache:
+        if (directory / ".git").exists():
+            cache[directory] = directory
+        elif directory.parent == directory:
+            cache[directory] = None
+        else:
+            cache[directory] = find_git_root(directory.parent, cache)
+    return cache[directory]
+
+
+def git_output(root, args, paths=(), *, stdin=None):
+    """
+    runs `git args paths...` in root and returns the \\0 separated output.
+
+    The paths are passed in chunks to stay below the limits of the command line.
+    """
+    import subprocess as sp
+
+    chunk_size = 1000
+    output = []
+    for i in range(0, max(len(paths), 1), chunk_size):
+        result = sp.run(
+            ["git", "--literal-pathspecs", *args, *paths[i : i + chunk_size]],
+            cwd=root,
+            input="".join(p + "\0" for p in stdin).encode() if stdin else None,
+            stdout=sp.PIPE,
+            stderr=sp.DEVNULL,
+        )
+        output += [p for p in result.stdout.decode().split("\0") if p]
+    return output
+
+
+def git_skip_reasons(filenames):
+    """
+    returns the reasons why some of the files should not be fixed.
+
+    The git checks are done with three git calls for each repository and not
+    for each file.
+    """
+    reasons = {}
+    repositories: dict = defaultdict(dict)
+    roots: dict = {}
+
+    for filename in filenames:
+        path = pathlib.Path(filename).resolve()
+        root = find_git_root(path.parent, roots)
+        if root is None:
+            reasons[filename] = "the file is not in a git repository"
+        else:
+            repositories[root][path.relative_to(root).as_posix()] = filename
+
+    for root, files in repositories.items():
+        paths = list(files)
+        tracked = set(git_output(root, ["ls-files", "-z", "--"], paths))
+        unstaged = set(git_output(root, ["diff", "--name-only", "-z", "--"], paths))
+        ignored = set(git_output(root, ["check-ignore", "-z", "--stdin"], stdin=paths))
+
+        for path, filename in files.items():
+            if path not in tracked:
+                reasons[filename] = "the file is not in a git repository"
+            elif path in unstaged:
+                reasons[filename] = "the file has unstaged changes"
+            elif path in ignored:
+                reasons[filename] = "the file is ignored by git"
+
+    return reasons
 
 
 global_recorder = ChangeRecorder()
-ChangeRecorder.current = global_recorder
-
-
-def code_stream(source):
-    idx = 0
-    p_line = 1
-    p_col = 0
-    while idx < len(source):
-        c = source[idx]
-        if c == "\r" and idx + 1 < len(source) and source[idx + 1] == "\n":
-            # \r\n
-            yield (p_line, p_col), idx, "\r\n"
-            idx += 1
-            p_line += 1
-            p_col = 0
-        elif c in "\r\n":
-            # \r or \n
-            yield (p_line, p_col), idx, c
-            p_line += 1
-            p_col = 0
+ChangeRecorder.default = global_recorder
+
+
+def split_lines(text, starts):
+    """
+    splits text at the `line_starts()`, the lines keep their line endings
+    """
+    lines = [text[a:b] for a, b in zip(starts, starts[1:])]
+    if starts[-1] < len(text):
+        lines.append(text[starts[-1] :])
+    return lines
+
+
+def format_range(start, stop):
+    # like difflib
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def unified_hunks(lines, changes, context):
+    """
+    yields the hunks of a unified diff for the sorted `changes`,
+    which are `(start, end, new_lines)` and replace `lines[start:end]`.
+    """
+    # changes which are separated by not more than 2*context lines are in the same hunk
+    groups = [[changes[0]]]
+    for change in changes[1:]:
+        if change[0] - groups[-1][-1][1] > 2 * context:
+            groups.append([change])
         else:
-            yield (p_line, p_col), idx, c
-            p_col += 1
-        idx += 1
+            groups[-1].append(change)
+
+    # difference between the line numbers of the new and the old code
+    offset = 0
+    for group in groups:
+        old_start = max(group[0][0] - context, 0)
+        old_end = min(group[-1][1] + context, len(lines))
+        new_length = (old_end - old_start) + sum(
+            len(new_lines) - (end - start) for start, end, new_lines in group
+        )
+
+        yield (
+            f"@@ -{format_range(old_start, old_end)}"
+            f" +{format_range(old_start + offset, old_start + offset + new_length)} @@\n"
+        )
+
+        pos = old_start
+        for start, end, new_lines in group:
+            for line in lines[pos:start]:
+                yield " " + line
+            for line in lines[start:end]:
+                yield "-" + line
+            for line in new_lines:
+                yield "+" + line
+            pos = end
+            offset += len(new_lines) - (end - start)
+        for line in lines[pos:old_end]:
+            yield " " + line
+
+
+def line_starts(text):
+    """
+    returns the offsets of the line beginnings in `text`.
+
+    `\\r\\n`, `\\r` and `\\n` are line endings.
+    """
+    return [0] + [m.end() for m in re.finditer("\r\n|\r|\n", text)]
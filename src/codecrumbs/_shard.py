@@ -0,0 +1,117 @@
+"""
+recording of the changes in child processes of `codecrumbs run`.
+
+The parent sets `CODECRUMBS_SHARD_DIR`. Every child process (fork or spawn)
+records its changes with its own recorder and writes them at exit to
+`<pid>.json` in this directory. The parent merges the shards afterwards.
+"""
+import atexit
+import json
+import os
+import shutil
+import signal
+import tempfile
+from pathlib import Path
+
+from ._rewrite_code import _current_recorder
+from ._rewrite_code import ChangeRecorder
+
+shard_dir_env = "CODECRUMBS_SHARD_DIR"
+parent_pid_env = "CODECRUMBS_SHARD_PARENT"
+
+_child_recorder = None
+
+
+def enable_child_recording():
+    """
+    called by the parent, returns the directory of the shards
+    """
+    shard_dir = tempfile.mkdtemp(prefix="codecrumbs-shards-")
+    os.environ[shard_dir_env] = shard_dir
+    os.environ[parent_pid_env] = str(os.getpid())
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_after_fork)
+    return Path(shard_dir)
+
+
+def disable_child_recording():
+    os.environ.pop(shard_dir_env, None)
+    os.environ.pop(parent_pid_env, None)
+
+
+def merge_shards(recorder, shard_dir):
+    """
+    loads the changes of all child processes into recorder and removes the shards
+    """
+    for shard in sorted(shard_dir.glob("*.json")):
+        recorder.load(json.loads(shard.read_text()))
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def _after_fork():
+    if os.environ.get(shard_dir_env):
+        start_child_recording()
+
+
+def start_child_recording():
+    """
+    called in the child process (after the fork or when codecrumbs is imported)
+    """
+    global _child_recorder
+
+    from ._config import configure
+
+    # the mode of the parent is not inherited by spawned processes
+    configure(mode="record")
+
+    # a forked child would otherwise flush the changes of its parent again
+    _child_recorder = ChangeRecorder()
+    ChangeRecorder.default = _child_recorder
+    _current_recorder.set(_child_recorder)
+
+    from multiprocessing.util import register_after_fork
+
+    atexit.register(flush)
+    _register_finalizer()
+    # multiprocessing clears the finalizers of a forked process before it runs the target
+    register_after_fork(_child_recorder, lambda recorder: _register_finalizer())
+
+    # the workers of multiprocessing.Pool are terminated
+    try:
+        if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, _flush_and_terminate)
+    except (ValueError, AttributeError):
+        pass
+
+
+def _register_finalizer():
+    from multiprocessing.util import Finalize
+
+    # multiprocessing exits its processes with os._exit(), atexit is not used
+    Finalize(None, flush, exitpriority=0)
+
+
+def _flush_and_terminate(signum, frame):
+    flush()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def flush():
+    shard_dir = os.environ.get(shard_dir_env)
+    if _child_recorder is None or not shard_dir:
+        return
+
+    data = _child_recorder.dump()
+    if not any(replacements for _, replacements in data):
+        return
+
+    shard = Path(shard_dir) / f"{os.getpid()}.json"
+    tmp = shard.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, shard)
+    except OSError:
+        # the parent is already finished
+        pass
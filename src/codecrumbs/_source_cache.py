@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import ast
+import bisect
+import io
+import itertools
+import os
+import pathlib
+import threading
+import token
+import tokenize
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from opcode import opname
+
+import executing
+
+from ._rewrite_code import ChangeRecorder
+from ._rewrite_code import line_starts
+
+
+@dataclass
+class Token:
+    filename: pathlib.Path
+    lineno: int
+    end_lineno: int
+    col_offset: int
+    end_col_offset: int
+    type: object
+    string: str
+
+    @property
+    def start(self):
+        return (self.lineno, self.col_offset)
+
+    @property
+    def end(self):
+        return (self.end_lineno, self.end_col_offset)
+
+
+class TokenIndex:
+    """
+    the tokens of one source file, sorted by their position.
+
+    The index is shared by all call sites in the same file (see `CachedSource.tokens`).
+
+    If `start` is given, code is only the part of the file which begins at this position.
+    The part is tokenized inside of parentheses, which results in the same tokens
+    for an expression which spans multiple lines as the tokenization of the whole file.
+    """
+
+    def __init__(self, filename, code, start=None):
+        if start is None:
+            tokens = tokenize.generate_tokens(io.StringIO(code).readline)
+        else:
+            lines = code.split("\n")
+            # the end of the code without the parentheses
+            end = (len(lines), len(lines[-1]) + (len(lines) == 1))
+            tokens = (
+                t
+                for t in tokenize.generate_tokens(io.StringIO(f"({code})").readline)
+                if (1, 1) <= t.start and t.end <= end
+            )
+
+        def position(lineno, col_offset):
+            if start is None:
+                return lineno, col_offset
+            if lineno == 1:
+                col_offset += start[1] - 1
+            return lineno + start[0] - 1, col_offset
+
+        self.tokens = []
+        for t in tokens:
+            lineno, col_offset = position(*t.start)
+            end_lineno, end_col_offset = position(*t.end)
+            self.tokens.append(
+                Token(
+                    filename=filename,
+                    type=t.type,
+                    string=t.string,
+                    lineno=lineno,
+                    end_lineno=end_lineno,
+                    col_offset=col_offset,
+                    end_col_offset=end_col_offset,
+                )
+            )
+        self.starts = [t.start for t in self.tokens]
+
+        self.names_and_ops = [
+            t for t in self.tokens if t.type in (token.NAME, token.OP)
+        ]
+        self.names_and_ops_starts = [t.start for t in self.names_and_ops]
+
+    def tokens_at(self, start, n):
+        """
+        returns the first `n` tokens which begin at or after `start`
+        """
+        i = bisect.bisect_left(self.starts, start)
+        return self.tokens[i : i + n]
+
+    def names_and_ops_before(self, end, n):
+        """
+        returns the last `n` NAME or OP tokens which begin before `end`
+        """
+        i = bisect.bisect_left(self.names_and_ops_starts, end)
+        return self.names_and_ops[max(i - n, 0) : i]
+
+    def names_and_ops_between(self, start, end):
+        """
+        returns the NAME and OP tokens which begin at or after `start` and before `end`
+        """
+        starts = self.names_and_ops_starts
+        return self.names_and_ops[
+            bisect.bisect_left(starts, start) : bisect.bisect_left(starts, end)
+        ]
+
+
+def char_offset(line, col_offset):
+    if line.isascii():
+        return col_offset
+    return len(line.encode()[:col_offset].decode())
+
+
+def char_range(node):
+    """
+    returns the start and end of an AST node as character positions
+    """
+    source = source_cache.get(node.filename)
+    if source is not None:
+        lines = source.lines
+    else:
+        import linecache
+
+        lines = linecache.getlines(node.filename)
+
+    return (
+        (node.lineno, char_offset(lines[node.lineno - 1], node.col_offset)),
+        (node.end_lineno, char_offset(lines[node.end_lineno - 1], node.end_col_offset)),
+    )
+
+
+# the nodes of the instructions which can trigger the lookup of a call site
+instruction_node_types = {
+    "LOAD_ATTR": ast.Attribute,
+    "LOAD_METHOD": ast.Attribute,
+    "STORE_ATTR": ast.Attribute,
+    "DELETE_ATTR": ast.Attribute,
+    # specialized calls of builtins are executed by PRECALL on 3.11
+    "PRECALL": ast.Call,
+    "CALL": ast.Call,
+    "CALL_KW": ast.Call,
+    "CALL_FUNCTION_EX": ast.Call,
+    "IMPORT_FROM": ast.ImportFrom,
+}
+
+
+class CachedSource(executing.Source):
+    """
+    `executing.Source` which uses the bounded `source_cache` instead of the
+    unbounded cache of `executing`.
+
+    The same object provides the text, the AST and the tokens for
+    `calling_expression`.
+    """
+
+    stat = None
+
+    @classmethod
+    def for_frame(cls, frame, use_cache=True):
+        source = source_cache.get(frame.f_code.co_filename)
+        if source is None:
+            # sources which are not stored in a file (doctests for example)
+            return super().for_frame(frame, use_cache)
+        return source
+
+    @cached_property
+    def node_index(self):
+        """
+        maps `id(node)` to a stable number for every node of the AST.
+
+        The nodes get also a `filename` attribute, which is used by `replace()`.
+        """
+        index = {}
+        if self.tree is not None:
+            for i, node in enumerate(ast.walk(self.tree)):
+                index[id(node)] = i
+                node.filename = self.filename
+        return index
+
+    def char_position(self, lineno, col_offset):
+        """
+        converts a position of the AST (utf-8 byte offset) into a character position
+        """
+        return lineno, char_offset(self.lines[lineno - 1], col_offset)
+
+    @cached_property
+    def line_starts(self):
+        return line_starts(self.text)
+
+    @cached_property
+    def tokens(self):
+        with ChangeRecorder.current.stats.timer("tokenize_time"):
+            return TokenIndex(pathlib.Path(self.filename), self.text)
+
+    def tokens_of(self, node):
+        """
+        returns the tokens of node, only the lines of the node are tokenized
+        """
+        start = self.char_position(node.lineno, node.col_offset)
+        end = self.char_position(node.end_lineno, node.end_col_offset)
+
+        lines = self.lines[start[0] - 1 : end[0]]
+        lines[-1] = lines[-1][: end[1]]
+        lines[0] = lines[0][start[1] :]
+
+        with ChangeRecorder.current.stats.timer("tokenize_time"):
+            try:
+                return TokenIndex(pathlib.Path(self.filename), "\n".join(lines), start)
+            except (tokenize.TokenError, SyntaxError):
+                pass
+        return self.tokens
+
+    @cached_property
+    def position_index(self):
+        """
+        maps `(node type, lineno, end_lineno, col_offset, end_col_offset)` to the
+        nodes, which can be triggered by an instruction with these `co_positions()`
+        """
+        index = {}
+        if self.tree is not None:
+            for node in ast.walk(self.tree):
+                if not isinstance(node, (ast.Attribute, ast.Call, ast.ImportFrom)):
+                    continue
+                positions = [
+                    (node.lineno, node.end_lineno, node.col_offset, node.end_col_offset)
+                ]
+                if isinstance(node, ast.Attribute) and node.lineno != node.end_lineno:
+                    # the instructions of an attribute which spans multiple lines
+                    # have only the position of the attribute name
+                    positions.append(
+                        (
+                            node.end_lineno,
+                            node.end_lineno,
+                            max(node.end_col_offset - len(node.attr), 0),
+                            node.end_col_offset,
+                        )
+                    )
+                for position in positions:
+                    index.setdefault((type(node), *position), []).append(node)
+        return index
+
+    def node_at(self, code, lasti):
+        """
+        returns the node of the instruction at `lasti` (python >= 3.11).
+
+        The positions of the instruction in `code.co_positions()` and the type of
+        the instruction are looked up in `position_index`.
+        None is returned if the instruction is not supported or the node is ambiguous.
+        """
+        # the code is stored with the node, which keeps the id unique
+        key = (id(code), lasti)
+        if key in self.nodes_at:
+            return self.nodes_at[key][1]
+
+        node = self._node_at(code, lasti)
+        self.nodes_at[key] = (code, node)
+        return node
+
+    @cached_property
+    def nodes_at(self):
+        # (id(code), lasti) -> (code, node)
+        return {}
+
+    def _node_at(self, code, lasti):
+        instructions = code.co_code
+        while lasti > 0 and opname[instructions[lasti]] == "CACHE":
+            # some specialized calls skip their inline cache before the call
+            lasti -= 2
+
+        node_type = instruction_node_types.get(opname[instructions[lasti]])
+        if node_type is None:
+            return None
+
+        positions = next(itertools.islice(code.co_positions(), lasti // 2, None), None)
+        if positions is None:
+            return None
+
+        nodes = self.position_index.get((node_type, *positions), ())
+        if len(nodes) != 1:
+            return None
+        return nodes[0]
+
+
+class SourceCache:
+    """
+    LRU cache of `CachedSource`s, which is limited by the number of entries and
+    the size of the cached source files.
+
+    Entries are invalidated when the mtime or the size of the file changes.
+    The cache can be used from multiple threads.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CachedSource] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def configure(self, *, max_entries=None, max_bytes=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._shrink()
+
+    def get(self, filename):
+        """
+        returns the source of filename or None if the file does not exist.
+        """
+        try:
+            st = os.stat(filename)
+        except (OSError, ValueError):
+            return None
+
+        stat = (st.st_mtime_ns, st.st_size)
+        stats = ChangeRecorder.current.stats
+
+        with self._lock:
+            return self._get(filename, stat, stats)
+
+    def _get(self, filename, stat, stats):
+        source = self._entries.get(filename)
+        if source is not None:
+            if source.stat == stat:
+                self._entries.move_to_end(filename)
+                stats.source_cache_hits += 1
+                return source
+            self._remove(filename)
+
+        stats.source_cache_misses += 1
+        with stats.timer("source_load_time"):
+            with tokenize.open(filename) as f:
+                lines = f.readlines()
+
+            source = CachedSource(filename, lines)
+        source.stat = stat
+        self._entries[filename] = source
+        self._bytes += stat[1]
+        self._shrink()
+        return source
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """
+        the size of the cached source files in bytes
+        """
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            for filename in list(self._entries):
+                self._remove(filename)
+
+    def _shrink(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, filename):
+        source = self._entries.pop(filename)
+        self._bytes -= source.stat[1]
+
+        # executing caches the results per code object,
+        # the cache is copied because other threads can add new results
+        executing_cache = CachedSource._class_local("__executing_cache", {})
+        for key in list(executing_cache):
+            if key[0].co_filename == filename:
+                executing_cache.pop(key, None)
+
+
+source_cache = SourceCache()
@@ -0,0 +1,325 @@
+"""
+static search for deprecated code, which does not require to run the code.
+
+The renamings are collected from the imported library and every file is parsed
+in a worker process. The types of the objects are not known:
+
+* only files which import the library (or are part of it) are scanned.
+* attributes are only renamed for the imported classes and modules of the library
+  and for the names which are explicitly renamed for every object.
+* arguments are renamed by the name of the called function.
+* names which are renamed differently in different places are ignored.
+"""
+from __future__ import annotations
+
+import ast
+import os
+import sys
+import tokenize
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+from ._argument import FunctionWrapper
+from ._attribute import RenameAttribute
+from ._module import RenameGlobal
+from ._rewrite_code import ChangeRecorder
+from ._rewrite_code import is_relative_to
+from ._source_cache import char_offset
+from ._source_cache import TokenIndex
+
+
+def in_modules(module_name, modules):
+    return any(module_name == m or module_name.startswith(m + ".") for m in modules)
+
+
+def collect_renamings(modules, attributes=()):
+    """
+    returns the renamings which are defined in `modules` (and their submodules)
+    as plain dicts, which can be passed to the worker processes.
+
+    `attributes` are the old attribute names which are renamed for every object
+    (see `renamed_attribute()`).
+    """
+    # the names of the classes in the modules (a class can be exported by many modules)
+    exported: dict[int, set[str]] = {}
+    for module_name, module in list(sys.modules.items()):
+        if module is not None and in_modules(module_name, modules):
+            for name, value in list(vars(module).items()):
+                if isinstance(value, type):
+                    exported.setdefault(id(value), set()).add(f"{module_name}.{name}")
+
+    # the attributes of the classes and modules, which are known by their qualified name
+    owners: dict[str, dict[str, str]] = {}
+    any_owner: dict[str, set[str]] = {}
+    for attribute in list(RenameAttribute.registry):
+        owner = attribute._owner
+        if in_modules(owner.__module__, modules):
+            names = exported.get(id(owner), set())
+            names.add(f"{owner.__module__}.{owner.__qualname__}")
+            for name in names:
+                owners.setdefault(name, {})[attribute.current_name] = attribute.new_name
+            any_owner.setdefault(attribute.current_name, set()).add(attribute.new_name)
+    for renaming in list(RenameGlobal.registry):
+        # module.old (`from module import old` is only fixed at runtime)
+        if in_modules(renaming.module_name, modules):
+            owners.setdefault(renaming.module_name, {})[
+                renaming.current_name
+            ] = renaming.new_name
+            any_owner.setdefault(renaming.current_name, set()).add(renaming.new_name)
+
+    arguments: dict[str, dict[str, set[str]]] = {}
+    for wrapper in list(FunctionWrapper.registry):
+        if in_modules(wrapper.f.__module__, modules):
+            function = arguments.setdefault(wrapper.f.__name__, {})
+            for old, new in wrapper.old_params.items():
+                function.setdefault(old, set()).add(new)
+
+    def unique(renamings):
+        return {old: new.pop() for old, new in renamings.items() if len(new) == 1}
+
+    unique_attributes = unique(any_owner)
+    return {
+        "modules": sorted({m.split(".")[0] for m in modules}),
+        "owners": owners,
+        "attributes": unique_attributes,
+        "any_receiver": sorted(set(attributes) & set(unique_attributes)),
+        "arguments": {name: unique(renamings) for name, renamings in arguments.items()},
+    }
+
+
+class ImportedNames:
+    """
+    the qualified names of the names which are bound by the imports of a module
+    """
+
+    def __init__(self, tree):
+        self.names: dict[str, str | None] = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname is not None:
+                        self.bind(alias.asname, alias.name)
+                    else:
+                        # import a.b binds a
+                        top = alias.name.split(".")[0]
+                        self.bind(top, top)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                for alias in node.names:
+                    if alias.name != "*":
+                        self.bind(
+                            alias.asname or alias.name, f"{node.module}.{alias.name}"
+                        )
+
+    def bind(self, name, qualname):
+        # names which are bound to different things are unknown
+        if self.names.get(name, qualname) != qualname:
+            qualname = None
+        self.names[name] = qualname
+
+    def qualname(self, node):
+        """
+        returns the qualified name of `name` or `name.attr...` if name is imported
+        """
+        if isinstance(node, ast.Name):
+            return self.names.get(node.id)
+        if isinstance(node, ast.Attribute):
+            base = self.qualname(node.value)
+            if base is not None:
+                return f"{base}.{node.attr}"
+        return None
+
+
+def renamed_attribute(renamings, names, receiver, attr):
+    """
+    returns the new name of `receiver.attr` or None if it is not renamed.
+
+    The attribute is only renamed if the receiver is an imported class or module
+    of the library (`mylib.Class.old` or `mylib.old`), because the attributes
+    of other objects can have the same name.
+    The `attributes` which are passed to `collect_renamings()` are renamed for every receiver.
+    """
+    if attr in renamings["any_receiver"]:
+        return renamings["attributes"][attr]
+
+    qualname = names.qualname(receiver)
+    if qualname is None:
+        return None
+    return renamings["owners"].get(qualname, {}).get(attr)
+
+
+def imports_module(tree, modules):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        if any(name.split(".")[0] in modules for name in names):
+            return True
+    return False
+
+
+def scan_file(filename, renamings, package_dirs=()):
+    """
+    returns the replacements `(start, end, text)` for the deprecated code in filename
+    """
+    try:
+        with tokenize.open(filename) as f:
+            code = f.read()
+        tree = ast.parse(code, filename)
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+        return []
+
+    if not any(
+        is_relative_to(Path(filename), d) for d in package_dirs
+    ) and not imports_module(tree, renamings["modules"]):
+        return []
+
+    lines = code.splitlines(keepends=True)
+
+    def position(lineno, col_offset):
+        return lineno, char_offset(lines[lineno - 1], col_offset)
+
+    tokens = None
+    replacements = []
+    names = ImportedNames(tree)
+    arguments = renamings["arguments"]
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            new_name = renamed_attribute(renamings, names, node.value, node.attr)
+            if new_name is None:
+                continue
+            # obj.old, (obj).old or obj with .old on the next line
+            if tokens is None:
+                tokens = TokenIndex(Path(filename), code)
+            start = position(node.value.end_lineno, node.value.end_col_offset)
+            end = position(node.end_lineno, node.end_col_offset)
+            between = tokens.names_and_ops_between(start, end)
+            if [t.string for t in between[-2:]] == [".", node.attr]:
+                name = between[-1]
+                replacements.append((name.start, name.end, new_name))
+
+        elif isinstance(node, ast.Call):
+            func = node.func
+
+            if (
+                isinstance(func, ast.Name)
+                and func.id in ("getattr", "hasattr", "setattr", "delattr")
+                and len(node.args) >= 2
+                and isinstance(node.args[1], ast.Constant)
+                and isinstance(node.args[1].value, str)
+            ):
+                # getattr(obj, "old")
+                namearg = node.args[1]
+                new_name = renamed_attribute(
+                    renamings, names, node.args[0], namearg.value
+                )
+                if new_name is not None:
+                    replacements.append(
+                        (
+                            position(namearg.lineno, namearg.col_offset),
+                            position(namearg.end_lineno, namearg.end_col_offset),
+                            f'"{new_name}"',
+                        )
+                    )
+
+            if isinstance(func, ast.Name):
+                renamed_args = arguments.get(func.id)
+            elif isinstance(func, ast.Attribute):
+                renamed_args = arguments.get(func.attr)
+            else:
+                renamed_args = None
+
+            if renamed_args:
+                # func(old=...)
+                for arg in node.keywords:
+                    if arg.arg not in renamed_args:
+                        continue
+                    if tokens is None:
+                        tokens = TokenIndex(Path(filename), code)
+                    start = position(arg.value.lineno, arg.value.col_offset)
+                    name, op = tokens.names_and_ops_before(start, 2)
+                    if op.string == "=" and name.string == arg.arg:
+                        replacements.append(
+                            (name.start, name.end, renamed_args[arg.arg])
+                        )
+
+    return replacements
+
+
+def scan_files(filenames, renamings, package_dirs=()):
+    return [
+        (str(filename), scan_file(filename, renamings, package_dirs))
+        for filename in filenames
+    ]
+
+
+def source_files(paths):
+    """
+    returns all python files in paths (files and directories), hidden directories are skipped
+    """
+    for path in paths:
+        path = Path(path).resolve()
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for file in sorted(files):
+                    if file.endswith(".py"):
+                        yield Path(root) / file
+        else:
+            yield path
+
+
+def scan(paths, modules, *, attributes=(), max_workers=None, recorder=None):
+    """
+    searches the deprecated code in paths, which uses one of the imported `modules`,
+    and records the changes in `recorder` (`ChangeRecorder.current` by default).
+
+    The names in `attributes` are renamed for every object (see `renamed_attribute()`).
+    """
+    if recorder is None:
+        recorder = ChangeRecorder.current
+
+    renamings = collect_renamings(modules, attributes)
+
+    # the files of the library are scanned even if they use relative imports
+    package_dirs = []
+    for module in renamings["modules"]:
+        module_file = getattr(sys.modules.get(module), "__file__", None)
+        if module_file is not None:
+            module_file = Path(module_file).resolve()
+            if module_file.name == "__init__.py":
+                module_file = module_file.parent
+            package_dirs.append(module_file)
+
+    filenames = list(source_files(paths))
+    chunksize = 64
+    chunks = [filenames[i : i + chunksize] for i in range(0, len(filenames), chunksize)]
+
+    if max_workers == 1 or len(chunks) <= 1:
+        results = [scan_files(chunk, renamings, package_dirs) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    scan_files, chunks, repeat(renamings), repeat(package_dirs)
+                )
+            )
+
+    for result in results:
+        recorder.load(
+            [
+                (
+                    filename,
+                    [
+                        (*start, *end, text, (filename, i))
+                        for i, (start, end, text) in enumerate(replacements)
+                    ],
+                )
+                for filename, replacements in result
+                if replacements
+            ]
+        )
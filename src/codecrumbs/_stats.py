@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Stats:
+    """
+    counters and timers for the work which is done by codecrumbs.
+
+    The counters are only updated when a new call site is analysed,
+    the call sites which are already known are not counted.
+    """
+
+    def __init__(self):
+        self.calling_expression_calls = 0
+        self.executing_time = 0.0
+        self.source_load_time = 0.0
+        self.tokenize_time = 0.0
+        self.source_cache_hits = 0
+        self.source_cache_misses = 0
+        self.traced_memory = None
+
+    def add(self, other):
+        """
+        adds the counters of `vars()` of another Stats object (from a pytest-xdist worker for example)
+        """
+        for name, value in other.items():
+            if name == "traced_memory":
+                continue
+            setattr(self, name, getattr(self, name) + value)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        adds the time of the block to the attribute `name`
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, name, getattr(self, name) + time.perf_counter() - started)
+
+    @property
+    def source_cache_hit_rate(self):
+        total = self.source_cache_hits + self.source_cache_misses
+        return self.source_cache_hits / total if total else None
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    returns an estimation of the memory which is used by obj and the objects it references
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(e, seen) for e in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def traced_memory():
+    """
+    returns the memory which is currently allocated by codecrumbs and executing,
+    or None if tracemalloc is not tracing.
+    """
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        return None
+
+    import executing
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(True, os.path.dirname(__file__) + os.sep + "*"),
+            tracemalloc.Filter(
+                True, os.path.dirname(executing.__file__) + os.sep + "*"
+            ),
+        ]
+    )
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    size /= 1024
+    for unit in ("KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import sqlite3
+
+from ._rewrite_code import ChangeRecorder
+from ._rewrite_code import file_stat
+
+schema = """
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT
+);
+CREATE TABLE IF NOT EXISTS replacements (
+    filename TEXT NOT NULL,
+    start_line INTEGER NOT NULL,
+    start_col INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    end_col INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    change_id INTEGER NOT NULL,
+    UNIQUE (filename, start_line, start_col, end_line, end_col, text)
+);
+"""
+
+
+def file_hash(filename):
+    try:
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class CrumbStore:
+    """
+    sqlite database which collects the recorded changes of many runs and processes.
+
+    Identical replacements are stored only once.
+    The content hash of every source file is stored together with the
+    replacements, which allows to skip files which were changed later.
+
+    The filenames are stored relative to the directory of the store,
+    which allows to apply the changes in another checkout of the project.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.base = pathlib.Path(os.path.abspath(self.path)).parent
+
+    def _relative(self, filename):
+        return os.path.relpath(os.path.abspath(filename), self.base)
+
+    def _absolute(self, filename):
+        return self.base / filename
+
+    def _connect(self):
+        connection = sqlite3.connect(str(self.path), timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(schema)
+        return connection
+
+    def add(self, recorder: ChangeRecorder):
+        """
+        adds the changes of the recorder to the store
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                change_ids: dict[int, int] = {}
+
+                for file in recorder._source_files.values():
+                    filename = self._relative(file.filename)
+                    if file_stat(file.filename) != file.stat:
+                        # the file was changed after the changes were recorded
+                        continue
+
+                    current_hash = file_hash(file.filename)
+                    if current_hash is None:
+                        continue
+
+                    row = connection.execute(
+                        "SELECT hash FROM files WHERE filename=?", (filename,)
+                    ).fetchone()
+                    if row is None or row[0] != current_hash:
+                        # the replacements of older versions are no longer valid
+                        connection.execute(
+                            "DELETE FROM replacements WHERE filename=?", (filename,)
+                        )
+                        connection.execute(
+                            "INSERT OR REPLACE INTO files VALUES (?,?)",
+                            (filename, current_hash),
+                        )
+
+                    for r in file.replacements:
+                        replacement = (filename, *r.start, *r.end, r.text)
+                        if connection.execute(
+                            "SELECT 1 FROM replacements WHERE filename=? AND start_line=?"
+                            " AND start_col=? AND end_line=? AND end_col=? AND text=?",
+                            replacement,
+                        ).fetchone():
+                            # identical replacements are stored only once
+                            continue
+
+                        if r.change_id not in change_ids:
+                            change_ids[r.change_id] = connection.execute(
+                                "INSERT INTO changes DEFAULT VALUES"
+                            ).lastrowid
+                        connection.execute(
+                            "INSERT OR IGNORE INTO replacements VALUES (?,?,?,?,?,?,?)",
+                            (*replacement, change_ids[r.change_id]),
+                        )
+        finally:
+            connection.close()
+
+    def load(self, recorder: ChangeRecorder):
+        """
+        loads the changes into the recorder.
+
+        Files which were changed after the changes were recorded are skipped.
+        """
+        connection = self._connect()
+        try:
+            files = connection.execute("SELECT filename, hash FROM files").fetchall()
+            data = []
+            for filename, stored_hash in files:
+                path = self._absolute(filename)
+                if file_hash(path) != stored_hash:
+                    print(
+                        f"{path}: skip fixing, because the file was changed after the fixes were recorded"
+                    )
+                    continue
+
+                data.append(
+                    (
+                        path,
+                        connection.execute(
+                            "SELECT start_line, start_col, end_line, end_col, text, change_id"
+                            " FROM replacements WHERE filename=? ORDER BY change_id",
+                            (filename,),
+                        ).fetchall(),
+                    )
+                )
+        finally:
+            connection.close()
+
+        recorder.load(data)
+
+    def prune(self):
+        """
+        removes the changes of files which were changed (or fixed) after the
+        changes were recorded.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                for filename, stored_hash in connection.execute(
+                    "SELECT filename, hash FROM files"
+                ).fetchall():
+                    if file_hash(self._absolute(filename)) != stored_hash:
+                        connection.execute(
+                            "DELETE FROM replacements WHERE filename=?", (filename,)
+                        )
+                        connection.execute(
+                            "DELETE FROM files WHERE filename=?", (filename,)
+                        )
+        finally:
+            connection.close()
@@ -1,4 +1,5 @@
 import pytest
+from codecrumbs._config import configure
 from codecrumbs._rewrite_code import ChangeRecorder
 
 
@@ -10,10 +11,33 @@ def pytest_addoption(parser):
         dest="codecrumbs_fix",
         help="Fix all deprecated code which is annotated by codecrumbs",
     )
+    group.addoption(
+        "--codecrumbs-store",
+        action="store",
+        dest="codecrumbs_store",
+        default=None,
+        metavar="PATH",
+        help="Add the fixes to a crumb store, which can be applied later with `codecrumbs apply PATH`",
+    )
+    group.addoption(
+        "--codecrumbs-profile",
+        action="store_true",
+        dest="codecrumbs_profile",
+        help="Show the overhead of codecrumbs in the terminal summary (uses tracemalloc if it is tracing)",
+    )
 
 
 def pytest_configure(config):
 
+    if config.option.codecrumbs_fix and config.option.codecrumbs_store:
+        raise pytest.UsageError(
+            "--codecrumbs-fix and --codecrumbs-store can not be used together"
+        )
+
+    if config.option.codecrumbs_fix or config.option.codecrumbs_store:
+        # the changes have to be recorded, even if CODECRUMBS_MODE=alias is set
+        configure(mode="record")
+
     if config.option.codecrumbs_fix:
         import sys
 
@@ -36,13 +60,56 @@ def pytest_load_initial_conftests(early_config, parser, args):
 @pytest.fixture(autouse=True)
 def record_changes(request):
     plugin = request.config.pluginmanager.getplugin("_codecrumbs")
-    with plugin.change_recorder.activate():
+    with plugin.change_recorder.activate(all_threads=True):
         yield plugin.change_recorder
 
 
+def pytest_sessionfinish(session):
+    workeroutput = getattr(session.config, "workeroutput", None)
+    if workeroutput is not None:
+        # pytest-xdist worker: send the changes to the controller
+        plugin = session.config.pluginmanager.getplugin("_codecrumbs")
+        recorder = plugin.change_recorder
+        workeroutput["codecrumbs"] = recorder.dump()
+        workeroutput["codecrumbs_stats"] = {
+            **vars(recorder.stats),
+            "introspection_time": recorder.introspection_time,
+            "skipped_hits": recorder.skipped_hits,
+        }
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: collect the changes of the workers
+    plugin = node.config.pluginmanager.getplugin("_codecrumbs")
+    workeroutput = getattr(node, "workeroutput", {})
+    recorder = plugin.change_recorder
+    recorder.load(workeroutput.get("codecrumbs", []))
+
+    stats = dict(workeroutput.get("codecrumbs_stats", {}))
+    recorder.add_introspection_time(stats.pop("introspection_time", 0.0))
+    recorder.skipped_hits += stats.pop("skipped_hits", 0)
+    recorder.stats.add(stats)
+
+
 def pytest_terminal_summary(terminalreporter, exitstatus, config):
     plugin = config.pluginmanager.getplugin("_codecrumbs")
 
+    if hasattr(config, "workerinput"):
+        return
+
+    if config.option.codecrumbs_store:
+        from codecrumbs._store import CrumbStore
+
+        CrumbStore(config.option.codecrumbs_store).add(plugin.change_recorder)
+
+    if config.option.codecrumbs_profile:
+        from codecrumbs._stats import traced_memory
+
+        plugin.change_recorder.stats.traced_memory = traced_memory()
+        terminalreporter.section("codecrumbs profile")
+        terminalreporter.write(plugin.change_recorder.profile_report())
+
     if exitstatus == 0 and config.option.codecrumbs_fix:
         num_fixes = plugin.change_recorder.num_fixes()
         plugin.change_recorder.fix_all()
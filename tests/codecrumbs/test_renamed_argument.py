@@ -85,3 +85,64 @@ def test_parameter_renamed_misuse():
         @argument_renamed("old", "new")
         def function(old=2):
             never_called()
+
+
+@pytest.mark.parametrize("variant", ["plain", "varargs"])
+def test_call_shim(variant):
+    if variant == "plain":
+
+        @argument_renamed("old", "new")
+        def function(a, new, b=2, *, c=3):
+            return (a, new, b, c)
+
+    else:
+
+        @argument_renamed("old", "new")
+        def function(a, new, b=2, *args, c=3):
+            return (a, new, b, c)
+
+    assert function(1, 5) == (1, 5, 2, 3)
+    assert function(1, new=5, c=4) == (1, 5, 2, 4)
+    assert function(a=1, new=5, b=6) == (1, 5, 6, 3)
+
+    # executing can not analyse calls in rewritten asserts on python < 3.11
+    with pytest.warns(DeprecationWarning):
+        result = function(1, old=5, c=4)
+    assert result == (1, 5, 2, 4)
+
+    with pytest.raises(TypeError, match="old=... and new=... can not be used"):
+        function(1, old=5, new=4)
+
+    with pytest.raises(TypeError, match="missing 1 required positional argument"):
+        function(1)
+
+    with pytest.raises(TypeError):
+        function(1, 2, unknown=5)
+
+
+def test_renamed_first_positional():
+    @argument_renamed("old", "a")
+    def function(a, b):
+        return (a, b)
+
+    assert function(1, 2) == (1, 2)
+    assert function(1, b=2) == (1, 2)
+
+    with pytest.warns(DeprecationWarning):
+        result = function(old=1, b=2)
+    assert result == (1, 2)
+
+    with pytest.raises(TypeError, match="missing 1 required positional argument"):
+        function(1)
+
+
+def test_bound_method_shim():
+    class Test:
+        @argument_renamed("old", "new")
+        def method(self, new=1):
+            return (self, new)
+
+    t = Test()
+    assert t.method() == (t, 1)
+    assert t.method(new=2) == (t, 2)
+    assert Test.method(t, 3) == (t, 3)
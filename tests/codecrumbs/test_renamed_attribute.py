@@ -1,8 +1,10 @@
+import os
 import sys
 
 import pytest
 from codecrumbs import argument_renamed
 from codecrumbs import attribute_renamed
+from codecrumbs._rewrite_code import ChangeRecorder
 
 from ..helper import never_called
 
@@ -63,6 +65,12 @@ def test_attribute_renamed(test_rewrite):
         warning=replace_warning("old", "new"),
     )
 
+    test_rewrite(
+        "assert (e).old == 1",
+        "assert (e).new == 1",
+        warning=replace_warning("old", "new"),
+    )
+
     e.new = 2
     test_rewrite(
         "assert e.old == 2", "assert e.new == 2", warning=replace_warning("old", "new")
@@ -278,3 +286,251 @@ def test_rename_replacements(test_rewrite, obj):
         warning=replace_warning("old_method", "new_method"),
         output="new\n" * 3,
     )
+
+
+def test_call_site_cache(monkeypatch):
+    import codecrumbs._argument
+    import codecrumbs._attribute
+    from codecrumbs._calling_expression import calling_expression
+
+    calls = []
+
+    def counting_calling_expression(back=1):
+        calls.append(back)
+        return calling_expression(back + 1)
+
+    monkeypatch.setattr(
+        codecrumbs._attribute, "calling_expression", counting_calling_expression
+    )
+    monkeypatch.setattr(
+        codecrumbs._argument, "calling_expression", counting_calling_expression
+    )
+
+    class Example:
+        old = attribute_renamed("new")
+
+        def __init__(self):
+            self.new = 1
+
+        @argument_renamed("old_arg", "new_arg")
+        def method(self, new_arg):
+            return new_arg
+
+    e = Example()
+
+    # executing can not analyse the rewritten asserts on python < 3.11
+    with pytest.warns(DeprecationWarning):
+        for i in range(10):
+            value = e.old
+            result = e.method(old_arg=i)
+            assert (value, result) == (1, i)
+
+    assert len(calls) == 2
+
+
+def test_call_sites_per_recorder():
+    import gc
+    import weakref
+
+    class Example:
+        old = attribute_renamed("new")
+        new = 1
+
+    def use(e):
+        return e.old
+
+    for _ in range(2):
+        # the call site is recorded again by the next recorder
+        with ChangeRecorder().activate() as recorder, pytest.warns(DeprecationWarning):
+            assert use(Example()) == 1
+        assert recorder.num_fixes() == 1
+
+    # the known call sites do not keep the descriptor alive
+    descriptor = weakref.ref(Example.__dict__["old"])
+    del Example
+    gc.collect()
+    assert descriptor() is None
+
+
+def test_call_sites_of_concurrent_recorders():
+    import threading
+    import warnings
+
+    class Example:
+        old = attribute_renamed("new")
+        new = 1
+
+    def use(e):
+        return e.old
+
+    recorders = [ChangeRecorder(), ChangeRecorder()]
+    barrier = threading.Barrier(len(recorders))
+
+    def record(recorder):
+        with recorder.activate(), warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            # both recorders are active when the call site is used
+            barrier.wait()
+            use(Example())
+            barrier.wait()
+
+    threads = [threading.Thread(target=record, args=(r,)) for r in recorders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [r.num_replacements() for r in recorders] == [1, 1]
+
+
+def test_non_ascii(test_rewrite):
+    class Example:
+        old = attribute_renamed("new")
+
+        def __init__(self):
+            self.new = 1
+
+        @argument_renamed("old_arg", "new_arg")
+        def method(self, text, new_arg):
+            print(text, new_arg)
+
+    e = Example()
+
+    test_rewrite(
+        'assert ("ä", e.old) == ("ä", 1)',
+        'assert ("ä", e.new) == ("ä", 1)',
+        warning=replace_warning("old", "new"),
+    )
+
+    test_rewrite(
+        'assert ("ä", getattr(e, "old")) == ("ä", 1)',
+        'assert ("ä", getattr(e, "new")) == ("ä", 1)',
+        warning='getattr(..., "old") should be replaced with getattr(..., "new") (fixable with codecrumbs)',
+    )
+
+    test_rewrite(
+        'e.method("äöü", old_arg=5)',
+        'e.method("äöü", new_arg=5)',
+        warning='argument name "old_arg=" should be replaced with "new_arg=" (fixable with codecrumbs)',
+        output="äöü 5\n",
+    )
+
+
+def test_specialized_call(test_rewrite):
+    class Example:
+        old = attribute_renamed("new")
+
+        def __init__(self):
+            self.new = 1
+
+    e = Example()
+
+    # the call of getattr gets specialized after a few iterations
+    test_rewrite(
+        'for _ in range(20): getattr(e, "old")',
+        'for _ in range(20): getattr(e, "new")',
+        warning='getattr(..., "old") should be replaced with getattr(..., "new") (fixable with codecrumbs)',
+    )
+
+
+def test_sampling():
+    class Example:
+        old = attribute_renamed("new")
+
+        def __init__(self):
+            self.new = 1
+
+    e = Example()
+
+    # executing can not analyse the rewritten asserts on python < 3.11
+    recorder = ChangeRecorder(max_introspection_time=0)
+    with recorder.activate(), pytest.warns(DeprecationWarning) as record:
+        for _ in range(3):
+            value = e.old
+    assert value == 1
+    assert record[0].filename == __file__
+    assert recorder.num_fixes() == 0
+    assert recorder.skipped_hits == 3
+
+    recorder = ChangeRecorder(max_sites_per_second=1)
+    with recorder.activate(), pytest.warns(DeprecationWarning):
+        values = (e.old, e.old, e.old)
+    assert values == (1, 1, 1)
+    assert recorder.num_fixes() == 1
+    assert recorder.skipped_hits == 2
+    assert recorder.introspection_time > 0
+
+
+@pytest.fixture
+def alias_mode():
+    from codecrumbs import configure
+
+    configure(mode="alias")
+    yield
+    configure(mode="record")
+
+
+def test_alias_mode(alias_mode, recwarn):
+    class Example:
+        old = attribute_renamed("new")
+
+        def __init__(self):
+            self.new = 1
+
+        @argument_renamed("old_arg", "new_arg")
+        def method(self, new_arg):
+            return new_arg
+
+    e = Example()
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        assert e.old == 1
+        e.old = 2
+        assert e.new == 2
+        assert getattr(e, "old") == 2
+        del e.old
+        assert not hasattr(e, "new")
+
+        assert e.method(old_arg=5) == 5
+        with pytest.raises(TypeError, match="old_arg=... and new_arg=..."):
+            e.method(old_arg=5, new_arg=3)
+
+    assert recorder.num_fixes() == 0
+    assert not recwarn.list
+
+
+def test_configure_mode():
+    import warnings
+    from codecrumbs import configure
+    from codecrumbs import _config
+
+    with pytest.raises(ValueError):
+        configure(mode="unknown")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        configure(mode="auto")
+        assert _config.alias_mode
+
+        warnings.filterwarnings("default", category=DeprecationWarning, module="foo")
+        configure(mode="auto")
+        assert not _config.alias_mode
+
+    configure(mode="record")
+
+
+def test_invalid_environment_mode():
+    import subprocess as sp
+
+    result = sp.run(
+        [
+            sys.executable,
+            "-c",
+            "import codecrumbs._config as c; assert not c.alias_mode",
+        ],
+        env={**os.environ, "CODECRUMBS_MODE": "unknown"},
+        stderr=sp.PIPE,
+        check=True,
+    )
+    assert "CODECRUMBS_MODE has to be one of" in result.stderr.decode()
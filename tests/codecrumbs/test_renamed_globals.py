@@ -0,0 +1,114 @@
+import sys
+import types
+import warnings
+
+import pytest
+from codecrumbs import globals_renamed
+from codecrumbs._rewrite_code import ChangeRecorder
+
+
+@pytest.fixture(params=["module", "package"])
+def renamed_mod(request, monkeypatch):
+    mod = types.ModuleType("renamed_mod")
+    if request.param == "package":
+        # importlib checks the names of packages with hasattr() first
+        mod.__path__ = []
+
+    def new_function():
+        return 5
+
+    mod.new_function = new_function
+    mod.NEW_CONSTANT = 3
+    mod.__getattr__ = globals_renamed(
+        "renamed_mod", {"old_function": "new_function", "OLD_CONSTANT": "NEW_CONSTANT"}
+    )
+    monkeypatch.setitem(sys.modules, "renamed_mod", mod)
+    return mod
+
+
+def replace_warning(old, new):
+    return f'".{old}" should be replaced with ".{new}" (fixable with codecrumbs)'
+
+
+def import_warning(old, new):
+    return f'"from renamed_mod import {old}" should be replaced with "from renamed_mod import {new}" (fixable with codecrumbs)'
+
+
+def test_module_attribute(test_rewrite, renamed_mod):
+    test_rewrite(
+        "assert renamed_mod.old_function() == 5",
+        "assert renamed_mod.new_function() == 5",
+        warning=replace_warning("old_function", "new_function"),
+    )
+
+    test_rewrite(
+        'assert getattr(renamed_mod, "OLD_CONSTANT") == 3',
+        'assert getattr(renamed_mod, "NEW_CONSTANT") == 3',
+        warning='getattr(..., "OLD_CONSTANT") should be replaced with getattr(..., "NEW_CONSTANT") (fixable with codecrumbs)',
+    )
+
+
+def test_import_from(test_rewrite, renamed_mod):
+    test_rewrite(
+        "from renamed_mod import old_function; assert old_function() == 5",
+        "from renamed_mod import new_function as old_function; assert old_function() == 5",
+        warning=import_warning("old_function", "new_function"),
+    )
+
+    test_rewrite(
+        "from renamed_mod import old_function as f; assert f() == 5",
+        "from renamed_mod import new_function as f; assert f() == 5",
+        warning=import_warning("old_function", "new_function"),
+    )
+
+    test_rewrite(
+        "from renamed_mod import (new_function, OLD_CONSTANT); assert OLD_CONSTANT == 3",
+        "from renamed_mod import (new_function, NEW_CONSTANT as OLD_CONSTANT); assert OLD_CONSTANT == 3",
+        warning=import_warning("OLD_CONSTANT", "NEW_CONSTANT"),
+    )
+
+
+def test_unknown_name(renamed_mod):
+    with pytest.raises(AttributeError, match="has no attribute 'missing'"):
+        renamed_mod.missing
+
+    with pytest.raises(ImportError):
+        exec("from renamed_mod import missing", {})
+
+    assert not hasattr(renamed_mod, "missing")
+
+
+def test_alias_mode(renamed_mod, monkeypatch):
+    monkeypatch.setattr("codecrumbs._config.alias_mode", True)
+
+    with ChangeRecorder().activate() as recorder:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            assert renamed_mod.old_function() == 5
+            namespace: dict = {}
+            exec("from renamed_mod import OLD_CONSTANT", namespace)
+
+            assert namespace["OLD_CONSTANT"] == 3
+
+    assert recorder.num_replacements() == 0
+
+
+def test_sampled_out(renamed_mod):
+    recorder = ChangeRecorder(max_introspection_time=0)
+    with recorder.activate():
+        with pytest.warns(
+            DeprecationWarning,
+            match=r'"renamed_mod.old_function" should be replaced with "renamed_mod.new_function"',
+        ) as record:
+            assert renamed_mod.old_function() == 5
+
+    assert record[0].filename == __file__
+    assert recorder.num_fixes() == 0
+
+
+def test_collect_renamings(renamed_mod):
+    from codecrumbs._static import collect_renamings
+
+    attributes = collect_renamings(["renamed_mod"])["attributes"]
+    assert attributes["old_function"] == "new_function"
+    assert attributes["OLD_CONSTANT"] == "NEW_CONSTANT"
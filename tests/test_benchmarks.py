@@ -0,0 +1,14 @@
+import runpy
+from pathlib import Path
+
+benchmarks = Path(__file__).parent.parent / "benchmarks"
+
+
+def test_benchmarks(capsys):
+    run = runpy.run_path(str(benchmarks / "run.py"))
+
+    assert run["main"](["--number", "20", "--repeat", "1", "--no-compare"]) == 0
+
+    output = capsys.readouterr().out
+    for name in run["benchmarks"]:
+        assert name in output
@@ -124,3 +124,99 @@ def test_property():
     f = foo()
     f.m
     print(f.m)
+
+
+def test_token_index():
+    from codecrumbs._source_cache import TokenIndex
+
+    code = "a = b . c\nf(x=1,\n  y = 2)\n"
+    index = TokenIndex("file.py", code)
+
+    assert [t.string for t in index.tokens_at((1, 5), 2)] == [".", "c"]
+    assert [t.string for t in index.tokens_at((1, 6), 2)] == [".", "c"]
+    assert [t.string for t in index.names_and_ops_before((3, 6), 2)] == ["y", "="]
+    assert [t.string for t in index.names_and_ops_before((2, 4), 2)] == ["x", "="]
+
+
+def test_token_index_of_segment():
+    from codecrumbs._source_cache import TokenIndex
+
+    # "b . c\n  .d" begins at line 3, column 4 of the file
+    index = TokenIndex("file.py", "b . c\n  .d", (3, 4))
+
+    assert [(t.string, t.start, t.end) for t in index.tokens] == [
+        ("b", (3, 4), (3, 5)),
+        (".", (3, 6), (3, 7)),
+        ("c", (3, 8), (3, 9)),
+        ("\n", (3, 9), (3, 10)),
+        (".", (4, 2), (4, 3)),
+        ("d", (4, 3), (4, 4)),
+    ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="co_positions() is new in 3.11")
+def test_without_executing(monkeypatch):
+    from codecrumbs._source_cache import CachedSource
+
+    def executing(frame):
+        raise AssertionError("executing should not be used")
+
+    monkeypatch.setattr(CachedSource, "executing", executing)
+
+    class foo:
+        @property
+        def p(self):
+            return calling_expression().expr
+
+        def m(self, i):
+            return calling_expression().expr
+
+    f = foo()
+
+    expr = f.p
+    assert isinstance(expr, ast.Attribute) and expr.attr == "p"
+
+    # fmt: off
+    expr = (f
+            .p)
+    # fmt: on
+    assert isinstance(expr, ast.Attribute) and expr.lineno != expr.end_lineno
+
+    expr = f.m(i=1)
+    assert isinstance(expr, ast.Call) and expr.keywords[0].arg == "i"
+
+    expr = getattr(f, "p")
+    assert isinstance(expr, ast.Call) and expr.func.id == "getattr"
+
+
+def test_ast_index():
+    def index():
+        return calling_expression().ast_index
+
+    def indices():
+        return index(), index()
+
+    first = indices()
+    assert first[0] != first[1]
+    assert indices() == first
+
+    result = calling_expression()
+    assert result.source.node_index[id(result.expr)] == result.ast_index
+
+
+def test_unknown_expression(monkeypatch):
+    from codecrumbs._source_cache import CachedSource
+
+    class NotFound:
+        def __init__(self, source):
+            self.source = source
+            self.node = None
+
+    executing = CachedSource.executing
+    monkeypatch.setattr(
+        CachedSource, "executing", lambda frame: NotFound(executing(frame).source)
+    )
+    monkeypatch.setattr(CachedSource, "node_at", lambda self, code, lasti: None)
+
+    with pytest.raises(AttributeError, match="can not find the expression at .*:"):
+        calling_expression()
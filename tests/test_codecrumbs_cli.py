@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 
 import patch  # type: ignore
@@ -132,3 +133,321 @@ for k, v in sorted(globals().items()):
     print(k, "=", v)
 '''
     compare(script, "test", "-q")
+
+
+def test_store_apply(env):
+    env.run("git", "init")
+    env.write(
+        "lib.py",
+        """
+import codecrumbs
+
+@codecrumbs.argument_renamed("old","new")
+def func(new):
+    print(new)
+""",
+    )
+    env.write(
+        "script_a.py",
+        """
+from lib import func
+func(old="a")
+""",
+    )
+    env.write(
+        "script_b.py",
+        """
+import sys
+from lib import func
+func(old="b")
+if len(sys.argv) > 1:
+    func(old="c")
+""",
+    )
+    env.run("git", "add", "lib.py", "script_a.py", "script_b.py")
+
+    env.run_codecrumbs("run", "--store", "crumbs.db", "script_a.py")
+    env.run_codecrumbs("run", "--store", "crumbs.db", "script_b.py")
+    env.run_codecrumbs("run", "--store", "crumbs.db", "script_b.py", "c")
+
+    assert "old=" in env.read("script_a.py")
+
+    env.run_codecrumbs("apply", "crumbs.db").stdout.no_fnmatch_line("*skip*")
+
+    assert env.read("script_a.py") == '\nfrom lib import func\nfunc(new="a")\n'
+    assert env.read("script_b.py") == (
+        '\nimport sys\nfrom lib import func\nfunc(new="b")\n'
+        'if len(sys.argv) > 1:\n    func(new="c")\n'
+    )
+
+
+def test_store_fix_exclusive(env):
+    result = env.run_codecrumbs("run", "--fix", "--store", "crumbs.db", "script.py")
+    assert result.ret == 2
+    result.stderr.fnmatch_lines(["*--store: not allowed with argument --fix*"])
+
+
+def test_store_relative_paths(tmp_path):
+    from codecrumbs._rewrite_code import Change
+    from codecrumbs._rewrite_code import ChangeRecorder
+    from codecrumbs._source_cache import Token
+    from codecrumbs._store import CrumbStore
+
+    checkout = tmp_path / "checkout"
+    filename = checkout / "src" / "a.py"
+    filename.parent.mkdir(parents=True)
+    filename.write_text("a=1\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        Change().replace(Token(filename, 1, 1, 2, 3, None, "1"), "2")
+
+    CrumbStore(checkout / "crumbs.db").add(recorder)
+
+    # the store is used in another checkout
+    moved = checkout.rename(tmp_path / "moved")
+
+    loaded = ChangeRecorder()
+    CrumbStore(moved / "crumbs.db").load(loaded)
+    loaded.fix_all(check_git=False)
+
+    assert (moved / "src" / "a.py").read_text() == "a=2\n"
+
+
+def test_store_changed_file(tmp_path, capsys):
+    from codecrumbs._rewrite_code import Change
+    from codecrumbs._rewrite_code import ChangeRecorder
+    from codecrumbs._source_cache import Token
+    from codecrumbs._store import CrumbStore
+
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        Change().replace(Token(filename, 1, 1, 2, 3, None, "1"), "2")
+
+    store = CrumbStore(tmp_path / "crumbs.db")
+    store.add(recorder)
+    store.add(recorder)
+
+    filename.write_text("a=10\n")
+
+    loaded = ChangeRecorder()
+    store.load(loaded)
+    assert loaded.num_fixes() == 0
+    assert capsys.readouterr().out == (
+        f"{filename}: skip fixing, because the file was changed after the fixes were recorded\n"
+    )
+
+    store.prune()
+    store.load(loaded)
+    assert capsys.readouterr().out == ""
+
+
+def test_store_duplicates(tmp_path):
+    import sqlite3
+
+    from codecrumbs._rewrite_code import Change
+    from codecrumbs._rewrite_code import ChangeRecorder
+    from codecrumbs._source_cache import Token
+    from codecrumbs._store import CrumbStore
+
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\nb=1\n")
+
+    def record(*lines):
+        recorder = ChangeRecorder()
+        with recorder.activate():
+            for line in lines:
+                Change().replace(Token(filename, line, line, 2, 3, None, "1"), "2")
+        return recorder
+
+    store = CrumbStore(tmp_path / "crumbs.db")
+    store.add(record(1))
+    store.add(record(1))
+    store.add(record(1, 2))
+
+    # the changes which only contain stored replacements are not added
+    connection = sqlite3.connect(str(tmp_path / "crumbs.db"))
+    try:
+        (num_changes,) = connection.execute("SELECT count(*) FROM changes").fetchone()
+    finally:
+        connection.close()
+    assert num_changes == 2
+
+    loaded = ChangeRecorder()
+    store.load(loaded)
+    assert loaded.num_fixes() == 2
+
+
+def test_profile(env):
+    env.write(
+        "script.py",
+        """
+import codecrumbs
+
+@codecrumbs.argument_renamed("old","new")
+def func(new):
+    pass
+
+for i in range(3):
+    func(old=i)
+""",
+    )
+
+    result = env.run_codecrumbs("run", "--profile", "--tracemalloc", "script.py")
+    result.stderr.fnmatch_lines(
+        [
+            "codecrumbs profile:",
+            "analysed call sites: 1 (skipped hits: 0)",
+            "call site analysis: *s",
+            "  executing: *s",
+            "  source loading: *s",
+            "  tokenize: *s",
+            "source cache: * hits (* hits, * misses)",
+            "replacements: 1 for 1 fixes in 1 files",
+            "recorder memory: *",
+            "source cache memory: *",
+            "traced memory: *",
+        ]
+    )
+
+
+def test_scan(env):
+    env.run("git", "init")
+    env.write(
+        "lib.py",
+        """
+import codecrumbs
+
+class A:
+    old = codecrumbs.attribute_renamed("new")
+
+@codecrumbs.argument_renamed("old_arg","new_arg")
+def func(new_arg):
+    pass
+""",
+    )
+
+    use = """
+import lib
+
+a = lib.A()
+print(a.old, getattr(a, "old"))
+lib.func(old_arg=5)
+"""
+    fixed = """
+import lib
+
+a = lib.A()
+print(a.new, getattr(a, "new"))
+lib.func(new_arg=5)
+"""
+    # files which do not import lib are not changed
+    unrelated = "a.old\n"
+
+    # enough files for more than one worker process
+    for i in range(100):
+        env.write(f"app/use_{i}.py", use)
+    env.write("app/unrelated.py", unrelated)
+    env.run("git", "add", "lib.py", "app")
+
+    result = env.run_codecrumbs("scan", "-m", "lib", "-a", "old", "app/use_0.py")
+    result.stdout.fnmatch_lines(['+print(a.new, getattr(a, "new"))'])
+    assert env.read("app/use_0.py") == use
+
+    env.run_codecrumbs("scan", "-m", "lib", "-a", "old", "-j", "2", "--fix", "app")
+
+    for i in range(100):
+        assert env.read(f"app/use_{i}.py") == fixed
+    assert env.read("app/unrelated.py") == unrelated
+
+
+def test_scan_receivers(env):
+    env.run("git", "init")
+    env.write(
+        "lib.py",
+        """
+import codecrumbs
+
+class A:
+    old = codecrumbs.attribute_renamed("new")
+    new = 1
+""",
+    )
+
+    use = """
+import collections
+import lib
+from lib import A as B
+
+other = collections.namedtuple("Other", "old")(5)
+print(other.old, getattr(other, "old"), B().old)
+print(lib.A.old, (lib.A).old, getattr(B, "old"))
+print(lib.A
+    .old)
+"""
+    fixed = """
+import collections
+import lib
+from lib import A as B
+
+other = collections.namedtuple("Other", "old")(5)
+print(other.old, getattr(other, "old"), B().old)
+print(lib.A.new, (lib.A).new, getattr(B, "new"))
+print(lib.A
+    .new)
+"""
+    env.write("use.py", use)
+    env.run("git", "add", "lib.py", "use.py")
+
+    # only the attributes of the classes from lib are renamed
+    env.run_codecrumbs("scan", "-m", "lib", "--fix", "use.py")
+    assert env.read("use.py") == fixed
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_run_multiprocessing(env, method):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{method} is not supported")
+
+    env.run("git", "init")
+    env.write(
+        "lib.py",
+        """
+import codecrumbs
+
+@codecrumbs.argument_renamed("old","new")
+def func(new):
+    return new
+""",
+    )
+    env.write(
+        "script.py",
+        f"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from lib import func
+
+def work(i):
+    return func(old=i)
+
+def pool_work(i):
+    return func(old=i)
+
+if __name__ == "__main__":
+    context = multiprocessing.get_context("{method}")
+    with ProcessPoolExecutor(2, mp_context=context) as executor:
+        assert list(executor.map(work, range(4))) == [0, 1, 2, 3]
+    with context.Pool(2) as pool:
+        assert pool.map(pool_work, range(4)) == [0, 1, 2, 3]
+""",
+    )
+    env.run("git", "add", "lib.py", "script.py")
+
+    env.run_codecrumbs("run", "--fix", "script.py")
+
+    script = env.read("script.py")
+    assert "old=" not in script
+    assert script.count("func(new=i)") == 2
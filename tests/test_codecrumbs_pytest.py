@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_help_message(testdir):
     result = testdir.runpytest(
         "--help",
@@ -40,3 +43,91 @@ def test_one(record_changes):
     result.assert_outcomes(passed=1)
 
     result.stdout.fnmatch_lines(["1 fixes where done by codecrumbs"])
+
+
+def test_codecrumbs_fix_xdist(pytester):
+    pytest.importorskip("xdist")
+
+    pytester.makepyfile(
+        lib="""
+from codecrumbs import attribute_renamed
+
+class A:
+    a=attribute_renamed("b")
+
+    def __init__(self):
+        self.b=5
+"""
+    )
+
+    files = []
+    for i in range(4):
+        files.append(
+            pytester.makepyfile(
+                **{
+                    f"test_{i}": """
+from lib import A
+
+def test_a():
+    assert A().a == 5
+
+def test_b():
+    assert A().a == 5
+"""
+                }
+            )
+        )
+
+    pytester.run("git", "init")
+    pytester.run("git", "add", *files)
+
+    result = pytester.runpytest("-n", "2", "--codecrumbs-fix")
+    result.assert_outcomes(passed=8)
+    result.stdout.fnmatch_lines(["8 fixes where done by codecrumbs"])
+
+    for file in files:
+        assert file.read_text().count("A().b == 5") == 2
+
+
+@pytest.mark.parametrize("xdist", [False, True])
+def test_codecrumbs_profile(pytester, xdist):
+    if xdist:
+        pytest.importorskip("xdist")
+
+    pytester.makepyfile(
+        test_profile="""
+from codecrumbs import attribute_renamed
+
+class A:
+    a=attribute_renamed("b")
+
+    def __init__(self):
+        self.b=5
+
+def test_a():
+    # pytest rewrites asserts, which executing can not analyse on python < 3.11
+    first = A().a
+    second = A().a
+    assert (first, second) == (5, 5)
+"""
+    )
+
+    args = ["-n", "1"] if xdist else ["-p", "no:xdist"]
+    result = pytester.runpytest("--codecrumbs-profile", *args)
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*codecrumbs profile*",
+            "analysed call sites: 2 (skipped hits: 0)",
+            "call site analysis: *s",
+            "replacements: 2 for 2 fixes in 1 files",
+        ]
+    )
+
+
+def test_codecrumbs_fix_store(pytester):
+    result = pytester.runpytest("--codecrumbs-fix", "--codecrumbs-store=crumbs.db")
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines(
+        ["*--codecrumbs-fix and --codecrumbs-store can not be used together*"]
+    )
@@ -32,3 +32,27 @@ def test_one(record_changes):
 
     # assert "print(x.b)" in source
     # result.stdout.fnmatch_lines(["1 fixes where done by codecrumbs"])
+
+
+def test_git_skip_reasons(pytester, tmp_path_factory):
+    from codecrumbs._rewrite_code import git_skip_reasons
+
+    pytester.run("git", "init")
+    clean = pytester.makepyfile(clean="a=1")
+    changed = pytester.makepyfile(changed="a=1")
+    untracked = pytester.makepyfile(untracked="a=1")
+    sub = pytester.mkpydir("sub")
+    in_sub = sub / "in_sub.py"
+    in_sub.write_text("a=1")
+
+    pytester.run("git", "add", clean, changed, in_sub)
+    changed.write_text("a=2")
+
+    outside = tmp_path_factory.mktemp("no_git") / "outside.py"
+    outside.write_text("a=1")
+
+    assert git_skip_reasons([clean, changed, untracked, in_sub, outside]) == {
+        changed: "the file has unstaged changes",
+        untracked: "the file is not in a git repository",
+        outside: "the file is not in a git repository",
+    }
@@ -0,0 +1,120 @@
+import importlib
+import sys
+import warnings
+
+import pytest
+from codecrumbs import install_import_hook
+
+
+@pytest.fixture
+def hook_env(tmp_path, monkeypatch):
+    (tmp_path / "hooklib.py").write_text(
+        """
+import codecrumbs
+
+class A:
+    old = codecrumbs.attribute_renamed("new")
+    OLD_KIND = codecrumbs.attribute_renamed("KIND")
+    KIND = "a"
+
+    def __init__(self):
+        self.new = 1
+
+@codecrumbs.argument_renamed("old_arg", "new_arg")
+def func(new_arg):
+    return new_arg
+
+def new_function():
+    return 4
+
+__getattr__ = codecrumbs.globals_renamed(__name__, {"old_function": "new_function"})
+"""
+    )
+    (tmp_path / "hookapp").mkdir()
+    (tmp_path / "hookapp" / "__init__.py").write_text("")
+    (tmp_path / "hookapp" / "use.py").write_text(
+        """
+import hooklib
+
+a = hooklib.A()
+a.old = 2
+result = (a.old, getattr(a, "old"), hooklib.func(old_arg=3))
+"""
+    )
+    (tmp_path / "hookapp" / "receivers.py").write_text(
+        """
+import collections
+import hooklib
+from hooklib import A as B
+
+other = collections.namedtuple("Other", "old OLD_KIND")(5, 6)
+result = (
+    hooklib.A.OLD_KIND,
+    getattr(B, "OLD_KIND"),
+    hooklib.old_function(),
+    other.old,
+    other.OLD_KIND,
+    getattr(other, "old"),
+)
+"""
+    )
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "meta_path", list(sys.meta_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    yield tmp_path
+    for name in ["hooklib", "hookapp", "hookapp.use", "hookapp.receivers"]:
+        sys.modules.pop(name, None)
+
+
+def test_import_hook(hook_env):
+    finder = install_import_hook("hooklib", ["hookapp"], attributes=["old"])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        use = importlib.import_module("hookapp.use")
+
+    assert use.result == (2, 2, 3)
+    assert finder in sys.meta_path
+
+    # the source is not changed and the bytecode is cached with a separate tag
+    assert "a.old" in (hook_env / "hookapp" / "use.py").read_text()
+    cached = list((hook_env / "hookapp" / "__pycache__").glob("use.*.pyc"))
+    assert [p.name.split(".")[2] for p in cached] == [finder.tag]
+
+    # the cached bytecode is used for the next import
+    del sys.modules["hookapp.use"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        use = importlib.import_module("hookapp.use")
+
+    assert use.result == (2, 2, 3)
+
+    finder.uninstall()
+    assert finder not in sys.meta_path
+
+
+def test_import_hook_other_modules(hook_env):
+    finder = install_import_hook("hooklib", ["other"])
+
+    with pytest.warns(DeprecationWarning):
+        importlib.import_module("hookapp.use")
+
+    finder.uninstall()
+
+
+def test_import_hook_receivers(hook_env):
+    # only the attributes of the imported classes and modules of hooklib are renamed
+    finder = install_import_hook("hooklib", ["hookapp"])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        receivers = importlib.import_module("hookapp.receivers")
+
+    assert receivers.result == ("a", "a", 4, 5, 6, 5)
+
+    with pytest.warns(DeprecationWarning):
+        use = importlib.import_module("hookapp.use")
+    assert use.result == (2, 2, 3)
+
+    finder.uninstall()
@@ -0,0 +1,66 @@
+import subprocess as sp
+import sys
+
+import pytest
+
+# modules which are only needed when deprecated code is used
+lazy_modules = [
+    "ast",
+    "concurrent.futures",
+    "dataclasses",
+    "difflib",
+    "executing",
+    "inspect",
+    "multiprocessing",
+    "subprocess",
+    "tokenize",
+]
+
+
+def imported_modules(*args):
+    """
+    returns the modules which are imported by `python -X importtime args...`
+    """
+    result = sp.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=sp.PIPE,
+        stderr=sp.PIPE,
+        check=True,
+    )
+    modules = set()
+    for line in result.stderr.decode().splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            if name != "imported package":
+                modules.add(name)
+    return modules
+
+
+def test_import_is_lazy():
+    # modules which are imported by the interpreter itself are not listed
+    baseline = imported_modules("-c", "pass")
+    modules = imported_modules("-c", "import codecrumbs") - baseline
+
+    assert "codecrumbs" in modules
+    assert sorted(m for m in lazy_modules if m in modules) == []
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "codecrumbs.install_import_hook",
+        """
+class A:
+    old = codecrumbs.attribute_renamed("new")
+    new = 1
+
+A().old
+""",
+    ],
+)
+def test_loaded_on_use(code, tmp_path):
+    # the source of the deprecated access has to be in a file
+    script = tmp_path / "script.py"
+    script.write_text(f"import codecrumbs\n{code}")
+    modules = imported_modules(str(script))
+    assert "ast" in modules
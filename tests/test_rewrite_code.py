@@ -1,12 +1,20 @@
 import inspect
 import io
+import os
+import sys
 import warnings
 from contextlib import redirect_stdout
 
 import pytest
 from codecrumbs._calling_expression import calling_expression
+from codecrumbs._rewrite_code import Change
 from codecrumbs._rewrite_code import ChangeRecorder
+from codecrumbs._rewrite_code import Conflict
+from codecrumbs._rewrite_code import line_starts
 from codecrumbs._rewrite_code import replace
+from codecrumbs._rewrite_code import Replacement
+from codecrumbs._rewrite_code import SourceFile
+from codecrumbs._source_cache import Token
 
 
 @pytest.fixture
@@ -86,8 +94,434 @@ def test_inc_number(rewrite_test):
 
 
 def test_overlapping(rewrite_test):
-    with pytest.raises(AssertionError):
-        rewrite_test(
-            "inc_number(inc_number(6))",
-            "inc_number(inc_number(7))",
+    # the inner call is recorded first and wins
+    rewrite_test(
+        "inc_number(inc_number(6))",
+        "inc_number(inc_number(7))",
+    )
+
+
+def test_resolve_replacements(tmp_path):
+    file = SourceFile(tmp_path / "a.py")
+    file.replacements = [
+        Replacement((1, 0), (1, 2), "a", 0),
+        Replacement((1, 4), (1, 6), "b", 0),
+        Replacement((1, 0), (1, 2), "a", 1),
+        Replacement((1, 1), (1, 3), "c", 2),
+        Replacement((1, 8), (1, 9), "d", 2),
+        Replacement((1, 4), (1, 6), "e", 3),
+        Replacement((1, 6), (1, 8), "f", 4),
+        Replacement((1, 10), (1, 12), "g", 5),
+        Replacement((1, 11), (1, 13), "h", 5),
+    ]
+
+    replacements, conflicts = file.resolve_replacements()
+
+    assert [(r.text, r.change_id) for r in replacements] == [
+        ("a", 0),
+        ("b", 0),
+        ("f", 4),
+    ]
+    assert conflicts == [Conflict(2, 0), Conflict(3, 0), Conflict(5, 5)]
+
+
+def test_merge_replacements(tmp_path):
+    filename = tmp_path / "a.py"
+    filename.write_text("f(a, b)\n")
+
+    file = SourceFile(filename)
+    file.replacements = [
+        Replacement((1, 2), (1, 3), "x", 0),
+        # nested in a replacement which contains the same change
+        Replacement((1, 0), (1, 4), "f(x,", 1),
+        Replacement((1, 5), (1, 6), "y", 1),
+        # the same code as the replacements of change 1
+        Replacement((1, 2), (1, 6), "x, y", 2),
+        # different code
+        Replacement((1, 2), (1, 6), "z", 3),
+        Replacement((1, 5), (1, 6), "b", 4),
+    ]
+
+    replacements, conflicts = file.resolve_replacements()
+
+    assert replacements == [Replacement((1, 0), (1, 6), "f(x, y", 0)]
+    assert conflicts == [Conflict(3, 0), Conflict(4, 0)]
+    assert file.new_code() == "f(x, y)\n"
+
+    # the result is cached until new replacements are added
+    assert file.resolve_replacements() is file.resolve_replacements()
+    file.add((1, 6), (1, 7), "]", 5)
+    assert file.resolve_replacements()[0][-1].text == "]"
+
+
+def test_line_starts():
+    assert line_starts("") == [0]
+    assert line_starts("a\nb\r\nc\rd") == [0, 2, 5, 7]
+    assert line_starts("a\n") == [0, 2]
+    assert line_starts("\r\r\n\n") == [0, 1, 3, 4]
+
+
+def test_fix_changed_file(tmp_path, capsys):
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\n")
+    unchanged = tmp_path / "b.py"
+    unchanged.write_text("b=1\n")
+    unchanged.chmod(0o755)
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        for file in (filename, unchanged):
+            Change().replace(
+                Token(file, 1, 1, 2, 3, None, "1"),
+                "2",
+            )
+
+    filename.write_text("a=10\n")
+
+    recorder.fix_all(check_git=False)
+
+    assert filename.read_text() == "a=10\n"
+    assert unchanged.read_text() == "b=2\n"
+    assert capsys.readouterr().out == (
+        f"{filename}: skip fixing, because the file was changed after the fixes were recorded\n"
+    )
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.py", "b.py"]
+    assert unchanged.stat().st_mode & 0o777 == 0o755
+
+
+def test_fix_links(tmp_path):
+    real = tmp_path / "real.py"
+    real.write_text("a=1\n")
+    real.chmod(0o755)
+    symlink = tmp_path / "symlink.py"
+    symlink.symlink_to(real)
+
+    hardlinked = tmp_path / "hardlinked.py"
+    hardlinked.write_text("b=1\n")
+    hardlink = tmp_path / "hardlink.py"
+    os.link(hardlinked, hardlink)
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        for file in (symlink, hardlink):
+            Change().replace(Token(file, 1, 1, 2, 3, None, "1"), "2")
+
+    recorder.fix_all(check_git=False)
+
+    assert symlink.is_symlink()
+    assert real.read_text() == "a=2\n"
+    assert real.stat().st_mode & 0o777 == 0o755
+    assert hardlinked.read_text() == "b=2\n"
+    assert hardlink.stat().st_ino == hardlinked.stat().st_ino
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "hardlink.py",
+        "hardlinked.py",
+        "real.py",
+        "symlink.py",
+    ]
+
+
+def test_fix_all_threads(tmp_path):
+    files = [tmp_path / f"f{i}.py" for i in range(10)]
+    for file in files:
+        file.write_text("a=1\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        for file in files:
+            Change().replace(Token(file, 1, 1, 2, 3, None, "1"), "2")
+
+    recorder.fix_all(check_git=False, max_workers=4)
+
+    assert [file.read_text() for file in files] == ["a=2\n"] * len(files)
+
+
+def test_dump_load(tmp_path):
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\nb=1\n")
+
+    def record(*lines):
+        recorder = ChangeRecorder()
+        with recorder.activate():
+            for line in lines:
+                Change().replace(Token(filename, line, line, 2, 3, None, "1"), "2")
+        return recorder
+
+    merged = ChangeRecorder()
+    merged.load(record(1).dump())
+    merged.load(record(1, 2).dump())
+
+    assert merged.num_fixes() == 2
+    assert [
+        (r.start, r.end, r.text) for r in merged.get_source_file(filename).replacements
+    ] == [
+        ((1, 2), (1, 3), "2"),
+        ((2, 2), (2, 3), "2"),
+    ]
+
+    merged.fix_all(check_git=False)
+    assert filename.read_text() == "a=2\nb=2\n"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_generate_patch(tmp_path, seed):
+    import difflib
+    import random
+
+    rnd = random.Random(seed)
+
+    filename = tmp_path / "a.py"
+    lines = [f"line_{i} = {i}\n" for i in range(rnd.randint(1, 40))]
+    if rnd.random() < 0.3:
+        lines[-1] = lines[-1].rstrip("\n")
+    filename.write_text("".join(lines))
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        for line in sorted(
+            rnd.sample(range(1, len(lines) + 1), rnd.randint(1, min(6, len(lines))))
+        ):
+            text = rnd.choice(["x", "line_0", f"line_{line - 1}"])
+            Change().replace(
+                Token(filename, line, line, 0, len(f"line_{line - 1}"), None, ""), text
+            )
+
+    source_file = recorder.get_source_file(filename)
+    old_code = filename.read_text().splitlines(keepends=True)
+    new_code = source_file.new_code().splitlines(keepends=True)
+
+    expected = list(
+        difflib.unified_diff(old_code, new_code, fromfile="a.py", tofile="a.py")
+    )
+    assert list(recorder.generate_patch(tmp_path)) == expected
+
+
+def test_generate_patch_eof(tmp_path):
+    filename = tmp_path / "a.py"
+    filename.write_text("a = 1\nb = 2\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        # the replacement ends at the beginning of the (missing) third line
+        Change().replace(Token(filename, 2, 3, 0, 0, None, ""), "c = 3\n")
+
+    assert (
+        "".join(recorder.generate_patch(tmp_path))
+        == """\
+--- a.py
++++ a.py
+@@ -1,2 +1,2 @@
+ a = 1
+-b = 2
++c = 3
+"""
+    )
+
+
+def test_generate_patch_multiline(tmp_path):
+    filename = tmp_path / "a.py"
+    filename.write_text("a = f(\n    1,\n    2,\n)\nb = 2\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        Change().replace(Token(filename, 1, 4, 4, 1, None, ""), "g(1, 2)")
+        Change().replace(Token(filename, 5, 5, 4, 5, None, ""), "3")
+
+    assert (
+        "".join(recorder.generate_patch(tmp_path))
+        == """\
+--- a.py
++++ a.py
+@@ -1,5 +1,2 @@
+-a = f(
+-    1,
+-    2,
+-)
+-b = 2
++a = g(1, 2)
++b = 3
+"""
+    )
+
+
+def test_periodic_flush(tmp_path):
+    import time
+
+    from codecrumbs._flush import PeriodicFlusher
+    from codecrumbs._store import CrumbStore
+
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\nb=1\n")
+
+    recorder = ChangeRecorder()
+    store = CrumbStore(tmp_path / "crumbs.db")
+    patch_file = tmp_path / "fixes.patch"
+
+    def record(line):
+        with recorder.activate():
+            Change().replace(Token(filename, line, line, 2, 3, None, "1"), "2")
+
+    def wait_for(condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.05)
+        assert False, "timeout"
+
+    store_flusher = PeriodicFlusher(recorder, store, max_pending=2).start()
+    patch_flusher = PeriodicFlusher(recorder, patch_file, interval=0.05).start()
+
+    record(1)
+    wait_for(patch_file.exists)
+    assert "+a=2" in patch_file.read_text()
+    assert store_flusher.pending() == 1
+
+    record(2)
+    wait_for(lambda: store_flusher.pending() == 0)
+    wait_for(lambda: "+b=2" in patch_file.read_text())
+
+    store_flusher.stop()
+    patch_flusher.stop()
+
+    loaded = ChangeRecorder()
+    store.load(loaded)
+    assert loaded.num_fixes() == 2
+
+
+def test_threads(tmp_path):
+    import threading
+
+    filename = tmp_path / "a.py"
+    filename.write_text("".join(f"a{i}=1\n" for i in range(800)))
+
+    def record(recorder, lines):
+        with recorder.activate():
+            for line in lines:
+                Change().replace(Token(filename, line, line, 3, 4, None, "1"), "2")
+
+    recorders = [ChangeRecorder() for _ in range(8)]
+    threads = [
+        threading.Thread(target=record, args=(recorder, range(1 + i, 801, 8)))
+        for i, recorder in enumerate(recorders)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    change_ids = set()
+    for i, recorder in enumerate(recorders):
+        replacements = recorder.get_source_file(filename).replacements
+        assert sorted(r.start[0] for r in replacements) == list(range(1 + i, 801, 8))
+        change_ids.update(r.change_id for r in replacements)
+    assert len(change_ids) == 800
+
+    # threads use the recorder which is activated for all threads
+    recorder = ChangeRecorder()
+    with recorder.activate(all_threads=True):
+        thread = threading.Thread(
+            target=lambda: Change().replace(Token(filename, 1, 1, 3, 4, None, "1"), "2")
         )
+        thread.start()
+        thread.join()
+    assert recorder.num_fixes() == 1
+
+
+def test_threads_first_hit(tmp_path, monkeypatch):
+    import threading
+
+    from codecrumbs import attribute_renamed
+    from codecrumbs._source_cache import source_cache
+
+    # the sources are evicted while other threads use them
+    monkeypatch.setattr(source_cache, "max_entries", 3)
+    # switch the threads more often
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    class Example:
+        old = attribute_renamed("new")
+        new = 1
+
+    files = []
+    for i in range(64):
+        filename = tmp_path / f"site_{i}.py"
+        filename.write_text(f"def f():\n    return e.old + {i}\n")
+        files.append(filename)
+
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def run(recorder):
+        try:
+            barrier.wait()
+            with recorder.activate():
+                for filename in files:
+                    namespace = {"e": Example()}
+                    exec(
+                        compile(filename.read_text(), str(filename), "exec"), namespace
+                    )
+                    namespace["f"]()
+        except Exception as e:
+            errors.append(e)
+
+    # catch_warnings() is not thread safe and is used outside of the threads
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            # the race conditions are not hit every time
+            for _ in range(3):
+                recorders = [ChangeRecorder() for _ in range(8)]
+                threads = [threading.Thread(target=run, args=(r,)) for r in recorders]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+    assert len(source_cache) <= 3
+
+
+def test_asyncio_tasks(tmp_path):
+    import asyncio
+
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\nb=1\n")
+
+    async def record(recorder, line):
+        with recorder.activate():
+            for _ in range(3):
+                await asyncio.sleep(0)
+                Change().replace(Token(filename, line, line, 2, 3, None, "1"), "2")
+
+    recorders = [ChangeRecorder(), ChangeRecorder()]
+
+    async def main():
+        await asyncio.gather(record(recorders[0], 1), record(recorders[1], 2))
+
+    asyncio.run(main())
+
+    for line, recorder in enumerate(recorders, 1):
+        # identical replacements are stored once
+        assert [r.start for r in recorder.get_source_file(filename).replacements] == [
+            (line, 2)
+        ]
+
+
+def test_deduplicate_replacements(tmp_path):
+    filename = tmp_path / "a.py"
+    filename.write_text("a=1\n")
+
+    recorder = ChangeRecorder()
+    with recorder.activate():
+        for _ in range(1000):
+            replace(Token(str(filename), 1, 1, 2, 3, None, "1"), "2")
+
+    file = recorder.get_source_file(filename)
+    assert len(file) == 1
+    assert recorder.num_fixes() == 1
+    assert file.replacements == [
+        Replacement((1, 2), (1, 3), "2", file.replacements[0].change_id)
+    ]
@@ -0,0 +1,48 @@
+import os
+
+from codecrumbs._source_cache import SourceCache
+
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, ns=(mtime, mtime))
+    return str(path)
+
+
+def test_invalidation(tmp_path):
+    cache = SourceCache()
+
+    filename = write(tmp_path / "a.py", "a=1\n", 1000)
+    source = cache.get(filename)
+    assert source.text == "a=1\n"
+    assert cache.get(filename) is source
+
+    write(tmp_path / "a.py", "a=2\n", 1000)
+    assert cache.get(filename) is source
+
+    write(tmp_path / "a.py", "a=2\n", 2000)
+    new_source = cache.get(filename)
+    assert new_source is not source
+    assert new_source.text == "a=2\n"
+
+    assert cache.get(str(tmp_path / "missing.py")) is None
+
+
+def test_limits(tmp_path):
+    cache = SourceCache(max_entries=2)
+
+    files = [write(tmp_path / f"f{i}.py", "x=1\n", 1000) for i in range(3)]
+    sources = [cache.get(f) for f in files]
+
+    assert list(cache._entries) == files[1:]
+
+    assert cache.get(files[1]) is sources[1]
+    cache.get(files[0])
+    assert list(cache._entries) == [files[1], files[0]]
+
+    cache.configure(max_bytes=5)
+    assert list(cache._entries) == [files[0]]
+    assert cache._bytes == 4
+
+    cache.clear()
+    assert cache._bytes == 0